@@ -0,0 +1 @@
+'''Benchmarks for dirtree, run with python -m bench'''
@@ -0,0 +1,148 @@
+import argparse
+import fnmatch
+import os
+import sys
+import tempfile
+
+from . import cases, runner
+from .trees import KINDS
+
+parser = argparse.ArgumentParser(
+    prog='python -m bench',
+    description='Time dirtree on synthetic trees and save the results as JSON.',
+)
+
+parser.add_argument(
+    '-o', '--output',
+    help='write the results to FILE; default: bench-COMMIT.json',
+    metavar='FILE',
+)
+
+parser.add_argument(
+    '--compare',
+    help='compare the results with an earlier run saved in FILE',
+    metavar='FILE',
+)
+
+parser.add_argument(
+    '--dir',
+    default=os.path.join(tempfile.gettempdir(), 'dirtree-bench'),
+    help='generate the trees under DIR, reusing those already there; only '
+    'directories generated by an earlier run are replaced',
+    metavar='DIR',
+)
+
+parser.add_argument(
+    '--scale',
+    type=float,
+    default=0.05,
+    help='size of the trees and inputs; 1 is the full size, e.g., 1M files in '
+    'the wide tree and 10k levels in the deep one (default: %(default)s)',
+)
+
+parser.add_argument(
+    '--seed',
+    type=int,
+    default=0,
+    help='seed for the generated trees and inputs',
+)
+
+parser.add_argument(
+    '--kinds',
+    default=','.join(KINDS),
+    help='comma separated trees to generate (default: %(default)s)',
+)
+
+parser.add_argument(
+    '-r', '--repeat',
+    type=int,
+    default=5,
+    help='timed runs of each benchmark (default: %(default)s)',
+)
+
+parser.add_argument(
+    '-k',
+    dest='select',
+    action='append',
+    help='only run benchmarks whose names match the shell PATTERN',
+    metavar='PATTERN',
+)
+
+parser.add_argument(
+    '--startup-margin',
+    type=float,
+    default=cases.STARTUP_MARGIN,
+    help='seconds a cold start of dirtree may take over a bare interpreter '
+    '(default: %(default)s)',
+    metavar='SECONDS',
+)
+
+parser.add_argument(
+    '--generate-only',
+    action='store_true',
+    help='generate the trees and exit',
+)
+
+
+def log(msg):
+    print(msg, file=sys.stderr, flush=True)
+
+
+def main(args=None):
+    args = parser.parse_args(args)
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        parser.error('unknown tree kinds: %s' % ', '.join(sorted(unknown)))
+
+    try:
+        trees = cases.generate_trees(
+            args.dir, kinds, args.scale, args.seed, log)
+    except FileExistsError as exc:
+        parser.error('%s: %s' % (exc.filename, exc.strerror))
+
+    if args.generate_only:
+        return 0
+
+    benchmarks = cases.collect(
+        trees, args.scale, args.seed, args.startup_margin)
+    if args.select:
+        benchmarks = list(benchmarks)
+        selected = {
+            bench.name for bench in benchmarks
+            if any(fnmatch.fnmatch(bench.name, pat) for pat in args.select)
+        }
+        # the baselines of those selected are run too, for their targets
+        selected.update([
+            bench.baseline for bench in benchmarks
+            if bench.name in selected and bench.baseline is not None
+        ])
+        benchmarks = [bench for bench in benchmarks if bench.name in selected]
+
+    report = runner.run(
+        benchmarks, repeat=args.repeat, log=log,
+        scale=args.scale, seed=args.seed, kinds=kinds,
+    )
+
+    output = args.output
+    if output is None:
+        output = 'bench-%s.json' % (report['environment']['commit'] or 'local')
+
+    runner.save(report, output)
+    log('results written to %s' % output)
+
+    if args.compare:
+        old = runner.load(args.compare)
+        for name, before, after, ratio, verdict in runner.compare(old, report):
+            log('%-32s %9.4fs -> %9.4fs  x%.2f %s' % (
+                name, before, after, ratio, verdict))
+
+    failed = any(
+        'error' in result or result.get('over_target')
+        for result in report['results']
+    )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+from dirtree.cli import parser
+from dirtree.entry import Entry
+from dirtree.options import Options
+from dirtree.pattern import exclude
+from dirtree.reader import Reader
+from dirtree.size_type import humanize_size, parse_size_type
+from dirtree.walker import EntryWalker
+
+from .runner import Benchmark
+from .trees import KINDS, generate
+
+#: a `.gitignore`-like mix of literal names, suffixes and globs
+EXCLUDE_PATTERNS = (
+    '.git', 'node_modules', '__pycache__', '*.pyc', '*.o', '*.so', '*.log',
+    '*.tar.gz', 'build', 'dist', '*~', '.*.swp', 'f1*', 'f*[0-9].txt',
+    '*cache*', 'src/lib*', 'tmp?', '[a-c]*.json', '*.md', 'vendor',
+)
+
+SIZE_STRINGS = (
+    '', '1', '512', 'K', 'KB', '4k', '1M', '10MB', '2G', '1T', '-16K', '+3P',
+    '1E', '100Z', 'Y',
+)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#: the most a cold start may take, in seconds, over the start of a bare
+#: interpreter on the same machine; dirtree is run thousands of times an hour
+#: on small directories, where start up is most of the time spent
+STARTUP_MARGIN = 0.05
+
+
+def options(*args):
+    return Options(parser.parse_args(list(args)))
+
+
+def _walk(opts, path):
+    def run(_):
+        for _ in EntryWalker(opts, Entry(path)).walk():
+            pass
+
+    return run
+
+
+def walker_benchmarks(trees):
+    '''one walk of every tree, with and without the exclude patterns'''
+    for kind, path in trees.items():
+        yield Benchmark(
+            'walker.%s' % kind, _walk(options(path), path), group='walker')
+
+    if 'mixed' in trees:
+        path = trees['mixed']
+        args = ['--exclude=%s' % pattern for pattern in EXCLUDE_PATTERNS]
+        yield Benchmark(
+            'walker.mixed.exclude', _walk(options(path, *args), path),
+            group='walker',
+        )
+
+
+def _entries(path, limit=200000):
+    entries = []
+    for _, entry in EntryWalker(options(path), Entry(path)).walk():
+        entries.append(entry)
+        if len(entries) >= limit:
+            break
+
+    return entries
+
+
+def exclude_benchmarks(trees):
+    '''the patterns against the entries of the mixed tree, one predicate at a
+    time and through `Options.exclude_matcher`'''
+    path = trees.get('mixed')
+    if path is None:
+        return
+
+    def setup():
+        return _entries(path)
+
+    def predicates(entries):
+        preds = [exclude(pattern) for pattern in EXCLUDE_PATTERNS]
+        for entry in entries:
+            any(pred(entry) for pred in preds)
+
+    def matcher(entries):
+        args = ['--exclude=%s' % pattern for pattern in EXCLUDE_PATTERNS]
+        match = options(path, *args).exclude_matcher
+        for entry in entries:
+            match(entry)
+
+    yield Benchmark(
+        'exclude.predicates', predicates, setup=setup, group='exclude')
+    yield Benchmark('exclude.matcher', matcher, setup=setup, group='exclude')
+
+
+def _paths(n, seed):
+    rng = random.Random(seed)
+    parts = ('usr', 'lib', 'python3', 'site-packages', 'a', 'bb', 'ccc', 'src')
+    return [
+        '/'.join(rng.choice(parts) for _ in range(rng.randint(1, 8)))
+        for _ in range(n)
+    ]
+
+
+def reader_benchmarks(scale, seed):
+    '''split `--files0-from` style input from memory and from a file'''
+    n = max(1000, int(2000000 * scale))
+
+    def buffered_setup():
+        return b'\0'.join(p.encode() for p in _paths(n, seed)) + b'\0'
+
+    def buffered(data):
+        for _ in Reader(io.BytesIO(data)):
+            pass
+
+    def mapped_setup():
+        fp = tempfile.TemporaryFile()
+        fp.write(buffered_setup())
+        return fp
+
+    def mapped(fp):
+        fp.seek(0)
+        for _ in Reader(fp):
+            pass
+
+    def short_setup():
+        return b'\n'.join(b'%d' % (i % 10) for i in range(n)) + b'\n'
+
+    yield Benchmark(
+        'reader.buffered', buffered, setup=buffered_setup, group='reader')
+    yield Benchmark('reader.mapped', mapped, setup=mapped_setup, group='reader')
+    yield Benchmark(
+        'reader.short_records', buffered, setup=short_setup, group='reader')
+
+
+def size_benchmarks(scale, seed):
+    n = max(1000, int(1000000 * scale))
+
+    def parse(strings):
+        for string in strings:
+            parse_size_type(string)
+
+    def humanize(values):
+        for value in values:
+            humanize_size(value)
+
+    def strings():
+        rng = random.Random(seed)
+        return [rng.choice(SIZE_STRINGS) for _ in range(n)]
+
+    def values():
+        rng = random.Random(seed)
+        return [int(rng.lognormvariate(12, 6)) for _ in range(n)]
+
+    yield Benchmark('size.parse', parse, setup=strings, group='size')
+    yield Benchmark('size.humanize', humanize, setup=values, group='size')
+
+
+def _python(*args):
+    def run(_):
+        subprocess.run(
+            [sys.executable] + list(args), cwd=_ROOT,
+            stdout=subprocess.DEVNULL, check=True,
+        )
+
+    return run
+
+
+def _cli(*args):
+    return _python('-m', 'dirtree.cli', *args)
+
+
+def startup_benchmarks(margin=STARTUP_MARGIN):
+    '''cold starts, which may take at most `margin` seconds longer than the
+    bare interpreter measured first'''
+    def tiny_setup():
+        path = os.path.join(tempfile.gettempdir(), 'dirtree-bench-tiny')
+        for name in ('a', 'b', 'c'):
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+            with open(os.path.join(path, name, 'file'), 'wb') as fp:
+                fp.write(b'x' * 4096)
+
+        return path
+
+    def tiny(path):
+        _cli('-c', path)(None)
+
+    yield Benchmark('startup.python', _python('-c', 'pass'), group='startup')
+    yield Benchmark(
+        'startup.import', _python('-c', 'import dirtree.cli'),
+        group='startup', target=margin, baseline='startup.python',
+    )
+    yield Benchmark(
+        'startup.tiny', tiny, setup=tiny_setup, group='startup',
+        target=margin, baseline='startup.python',
+    )
+
+
+def cli_benchmarks(trees):
+    '''the whole program, from interpreter start up to the last line'''
+    yield Benchmark('cli.startup', _cli('--help'), group='cli')
+
+    for kind in ('mixed', 'links', 'wide'):
+        path = trees.get(kind)
+        if path is not None:
+            yield Benchmark('cli.%s' % kind, _cli('-a', path), group='cli')
+
+    path = trees.get('mixed')
+    if path is not None:
+        yield Benchmark(
+            'cli.mixed.human_time', _cli('-ach', path, '--time'), group='cli')
+        yield Benchmark(
+            'cli.mixed.summary', _cli('-sc', '-j4', path), group='cli')
+
+
+def generate_trees(base, kinds=KINDS, scale=1.0, seed=0, log=None):
+    trees = {}
+    for kind in kinds:
+        if log is not None:
+            log('generating %s tree' % kind)
+
+        trees[kind] = generate(kind, os.path.join(base, kind), scale, seed)
+
+    return trees
+
+
+def collect(trees, scale=1.0, seed=0, startup_margin=STARTUP_MARGIN):
+    '''every benchmark, for the generated `trees`'''
+    yield from walker_benchmarks(trees)
+    yield from exclude_benchmarks(trees)
+    yield from reader_benchmarks(scale, seed)
+    yield from size_benchmarks(scale, seed)
+    yield from startup_benchmarks(startup_margin)
+    yield from cli_benchmarks(trees)
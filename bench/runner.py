@@ -0,0 +1,195 @@
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+#: bumped whenever the layout of the results changes
+SCHEMA = 1
+
+
+class Benchmark:
+    '''A named, timed callable
+
+    `setup` is called once and its result passed to `func` on every run, so
+    fixtures (trees, input buffers, options) stay out of the timings. With a
+    `target`, in seconds, the fastest run must not take longer. With a
+    `baseline` as well, the name of a benchmark run earlier, `target` is how
+    much longer than the fastest run of that one it may take instead.
+
+    :type name: str
+    :type func: callable
+    :type setup: callable or None
+    :type group: str
+    :type target: float or None
+    :type baseline: str or None
+    '''
+
+    def __init__(self, name, func, setup=None, group='', target=None,
+                 baseline=None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.group = group
+        self.target = target
+        self.baseline = baseline
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.name)
+
+
+def measure(bench, repeat=5, warmup=1):
+    '''time `bench` `repeat` times after `warmup` untimed runs; the garbage
+    collector is paused during each run
+
+    :rtype: dict
+    '''
+    arg = bench.setup() if bench.setup is not None else None
+
+    for _ in range(warmup):
+        bench.func(arg)
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            bench.func(arg)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    return {
+        'name': bench.name,
+        'group': bench.group,
+        'repeat': repeat,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'times': times,
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return out.stdout.decode().strip()
+
+
+def environment(**params):
+    '''what the results were measured with, so runs can be told apart'''
+    return dict(
+        schema=SCHEMA,
+        commit=_git_commit(),
+        python=sys.version.split()[0],
+        implementation=platform.python_implementation(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+        timestamp=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        **params
+    )
+
+
+def run(benchmarks, repeat=5, warmup=1, log=None, **params):
+    '''measure every benchmark; a benchmark that raises is recorded with its
+    error instead of timings, and the rest still run. A benchmark slower than
+    its target is marked `over_target`; one whose baseline didn't run, or
+    failed, has no target
+
+    :type benchmarks: [bench.runner.Benchmark]
+    :rtype: dict
+    '''
+    results = []
+    fastest = {}
+    for bench in benchmarks:
+        try:
+            result = measure(bench, repeat, warmup)
+        except Exception as exc:
+            result = {
+                'name': bench.name, 'group': bench.group,
+                'error': '%s: %s' % (type(exc).__name__, exc),
+            }
+        else:
+            fastest[bench.name] = result['min']
+            target = bench.target
+            if target is not None and bench.baseline is not None:
+                base = fastest.get(bench.baseline)
+                target = None if base is None else base + target
+
+            if target is not None:
+                result['target'] = target
+                result['over_target'] = result['min'] > target
+
+        if log is not None:
+            log(format_result(result))
+
+        results.append(result)
+
+    return {'environment': environment(**params), 'results': results}
+
+
+def format_result(result):
+    if 'error' in result:
+        error = result['error']
+        if len(error) > 120:
+            error = error[:117] + '...'
+
+        return '%-32s %s' % (result['name'], error)
+
+    line = '%-32s min %9.4fs  median %9.4fs  stdev %8.4fs' % (
+        result['name'], result['min'], result['median'], result['stdev'])
+    if result.get('over_target'):
+        line += '  over target %.4fs' % result['target']
+
+    return line
+
+
+def save(report, path):
+    with open(path, 'w') as fp:
+        json.dump(report, fp, indent=2, sort_keys=True)
+        fp.write('\n')
+
+
+def load(path):
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def compare(old, new, threshold=0.05):
+    '''yield `(name, old_min, new_min, ratio, verdict)` for the benchmarks in
+    both reports; a ratio beyond `threshold` either way is a regression or an
+    improvement
+
+    :type old: dict
+    :type new: dict
+    '''
+    before = {
+        result['name']: result for result in old['results']
+        if 'error' not in result
+    }
+
+    for result in new['results']:
+        prev = before.get(result['name'])
+        if prev is None or 'error' in result:
+            continue
+
+        ratio = result['min'] / prev['min'] if prev['min'] else float('inf')
+        if ratio > 1 + threshold:
+            verdict = 'slower'
+        elif ratio < 1 - threshold:
+            verdict = 'faster'
+        else:
+            verdict = ''
+
+        yield result['name'], prev['min'], result['min'], ratio, verdict
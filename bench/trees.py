@@ -0,0 +1,264 @@
+import errno
+import json
+import os
+import random
+
+#: the number of entries of each kind of tree at `scale` 1
+SIZES = {
+    'wide': 1000000,
+    'deep': 10000,
+    'links': 100000,
+    'loops': 1000,
+    'mixed': 200000,
+}
+
+KINDS = tuple(SIZES)
+
+_MANIFEST = '.dirtree-bench.json'
+
+_EXTENSIONS = (
+    '.py', '.pyc', '.c', '.h', '.o', '.so', '.txt', '.md', '.json', '.log',
+    '.jpg', '.png', '.tar.gz', '',
+)
+
+_DIR_NAMES = (
+    'src', 'lib', 'build', 'dist', 'node_modules', '.git', 'objects', 'test',
+    'docs', 'cache', '__pycache__', 'tmp', 'assets', 'vendor',
+)
+
+
+def count(kind, scale=1.0):
+    '''the number of entries generated for `kind` at `scale`'''
+    return max(1, int(SIZES[kind] * scale))
+
+
+def _touch(name, dir_fd, size=0):
+    fd = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644,
+                 dir_fd=dir_fd)
+    try:
+        if size:
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def _mkdir(name, dir_fd):
+    os.mkdir(name, dir_fd=dir_fd)
+    return os.open(name, os.O_RDONLY | os.O_DIRECTORY, dir_fd=dir_fd)
+
+
+def _remove(path):
+    '''remove the tree at `path`, depth first, holding one directory open at
+    a time and climbing back out through `..`; `shutil.rmtree` recurses once
+    per level, too deep for the deep tree'''
+    flags = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+    fd = os.open(path, flags)
+    names = []
+    try:
+        while True:
+            with os.scandir(fd) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        child = os.open(entry.name, flags, dir_fd=fd)
+                        os.close(fd)
+                        fd = child
+                        names.append(entry.name)
+                        break
+
+                    os.unlink(entry.name, dir_fd=fd)
+                else:
+                    if not names:
+                        break
+
+                    parent = os.open('..', flags, dir_fd=fd)
+                    os.close(fd)
+                    fd = parent
+                    os.rmdir(names.pop(), dir_fd=fd)
+    finally:
+        os.close(fd)
+
+    os.rmdir(path)
+
+
+def _wide(root_fd, n, rng):
+    '''`n` empty files in one directory'''
+    for i in range(n):
+        _touch('f%07d%s' % (i, rng.choice(_EXTENSIONS)), root_fd)
+
+
+def _deep(root_fd, n, rng):
+    '''a chain of `n` directories, each holding one small file; made by
+    name, the deepest paths are well past `PATH_MAX`'''
+    fd = os.dup(root_fd)
+    try:
+        for i in range(n):
+            _touch('f', fd, rng.randrange(4096))
+            child = _mkdir('d', fd)
+            os.close(fd)
+            fd = child
+    finally:
+        os.close(fd)
+
+
+def _links(root_fd, n, rng):
+    '''`n` names for a much smaller number of inodes, spread over directories
+    so most links cross directories'''
+    inodes = max(1, n // 10)
+    dirs = max(1, n // 1000)
+
+    fds = [_mkdir('d%04d' % i, root_fd) for i in range(dirs)]
+    try:
+        names = []
+        for i in range(inodes):
+            fd = rng.choice(fds)
+            name = 'i%07d' % i
+            _touch(name, fd, rng.randrange(64 * 1024))
+            names.append((fd, name))
+
+        for i in range(n - inodes):
+            src_fd, src = rng.choice(names)
+            os.link(src, 'l%07d' % i, src_dir_fd=src_fd,
+                    dst_dir_fd=rng.choice(fds))
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def _loops(root_fd, n, rng):
+    '''nested directories whose symlinks point back up the tree, to each other
+    and at themselves'''
+    fd = os.dup(root_fd)
+    depth = 0
+    try:
+        for i in range(n):
+            kind = rng.randrange(4)
+            if kind == 0:
+                os.symlink('.', 'self%d' % i, dir_fd=fd)
+            elif kind == 1 and depth:
+                up = '/'.join(['..'] * rng.randint(1, depth))
+                os.symlink(up, 'up%d' % i, dir_fd=fd)
+            elif kind == 2:
+                os.symlink('b%d' % i, 'a%d' % i, dir_fd=fd)
+                os.symlink('a%d' % i, 'b%d' % i, dir_fd=fd)
+            else:
+                child = _mkdir('d%d' % i, fd)
+                os.close(fd)
+                fd = child
+                depth += 1
+    finally:
+        os.close(fd)
+
+
+def _mixed(root_fd, n, rng):
+    '''a source-checkout-like tree: a few large directories, many small ones,
+    file sizes spread over several orders of magnitude, the odd symlink and
+    hard link'''
+    stack = [(os.dup(root_fd), '')]
+    made = 0
+    files = []
+    try:
+        while made < n:
+            fd, rel = stack[-1]
+            depth = len(stack) - 1
+            roll = rng.random()
+
+            if roll < 0.08 and depth < 24:
+                name = '%s%d' % (rng.choice(_DIR_NAMES), made)
+                stack.append((_mkdir(name, fd), rel + name + '/'))
+            elif roll < 0.14 and depth:
+                os.close(stack.pop()[0])
+                continue
+            elif roll < 0.145 and files:
+                # relative to the root, the directory may be closed by now
+                os.link(rng.choice(files), 'hl%d' % made,
+                        src_dir_fd=root_fd, dst_dir_fd=fd)
+            elif roll < 0.15:
+                os.symlink('../' * rng.randint(0, depth) + 'missing%d' % made,
+                           'sl%d' % made, dir_fd=fd)
+            else:
+                name = 'f%d%s' % (made, rng.choice(_EXTENSIONS))
+                _touch(name, fd, int(rng.lognormvariate(8, 2.5)))
+                if rng.random() < 0.01:
+                    files.append(rel + name)
+
+            made += 1
+    finally:
+        for fd, _ in stack:
+            os.close(fd)
+
+
+_GENERATORS = {
+    'wide': _wide,
+    'deep': _deep,
+    'links': _links,
+    'loops': _loops,
+    'mixed': _mixed,
+}
+
+
+def generate(kind, path, scale=1.0, seed=0):
+    '''create the synthetic tree `kind` at `path`, or reuse the tree already
+    there if it was made with the same parameters; returns the root of the
+    tree, inside `path`
+
+    The same `kind`, `scale` and `seed` always produce the same names, shapes
+    and sizes. Sizes are set with `ftruncate`, so files are sparse and the tree
+    is cheap to build; hard links keep `links` and `mixed` from duplicating
+    data.
+
+    Only a tree generated here, recognized by its manifest, is replaced; any
+    other file or non-empty directory at `path` is left alone and raises
+    `FileExistsError`.
+
+    :type kind: str
+    :type path: str
+    :type scale: float
+    :type seed: int
+    '''
+    entries = count(kind, scale)
+    manifest = {'kind': kind, 'scale': scale, 'seed': seed, 'entries': entries}
+    manifest_path = os.path.join(path, _MANIFEST)
+
+    try:
+        with open(manifest_path) as fp:
+            if json.load(fp) == manifest:
+                return tree_path(path)
+    except (OSError, ValueError):
+        pass
+
+    if os.path.lexists(manifest_path):
+        _remove(path)
+    elif os.path.isdir(path) and not os.path.islink(path):
+        if os.listdir(path):
+            raise FileExistsError(
+                errno.EEXIST, 'not a generated tree, refusing to replace it',
+                path)
+    elif os.path.lexists(path):
+        raise FileExistsError(errno.EEXIST, 'not a directory', path)
+
+    os.makedirs(path, exist_ok=True)
+    # marks the directory as generated from the start, so an interrupted run
+    # is replaced next time
+    with open(manifest_path, 'w') as fp:
+        json.dump({'kind': kind, 'complete': False}, fp)
+
+    root_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        fd = _mkdir('tree', root_fd)
+        try:
+            _GENERATORS[kind](fd, manifest['entries'], random.Random(seed))
+        finally:
+            os.close(fd)
+    finally:
+        os.close(root_fd)
+
+    # written last, so an interrupted run is generated again
+    with open(manifest_path, 'w') as fp:
+        json.dump(manifest, fp)
+
+    return tree_path(path)
+
+
+def tree_path(path):
+    '''the root of the tree generated at `path`'''
+    return os.path.join(path, 'tree')
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
+import sys
+
 from dirtree.cli import main
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
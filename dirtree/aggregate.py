@@ -0,0 +1,417 @@
+import os
+import sys
+from collections import deque
+
+from .entry import Entry
+from .filters import descend_filter, shown_filter
+from .links import InodeSet
+from .mixins import FieldsMixin
+from .schedule import RootScheduler
+from .walker import EntryWalker, Prefetcher
+
+
+class Total(FieldsMixin):
+    '''The accumulated usage of an entry and everything beneath it
+
+    `size` is in bytes, or a count of entries when `options.inodes` is set.
+    With `options.time`, `time_ns` is the newest such time of the entry and
+    everything counted beneath it, in nanoseconds. The grand total produced
+    by `--total` has no entry.
+
+    :type entry: dirtree.entry.Entry or None
+    :type size: int
+    :type depth: int
+    :type time_ns: int or None
+    '''
+
+    __repr_fields__ = ('path', 'size', 'depth', 'time_ns')
+
+    def __init__(self, entry, size, depth=0, time_ns=None):
+        self.entry = entry
+        self.size = size
+        self.depth = depth
+        self.time_ns = time_ns
+
+    @property
+    def path(self):
+        if self.entry is None:
+            return 'total'
+
+        return self.entry.path
+
+
+class Level:
+    '''What was collected at one depth of a post-order walk, from the finished
+    entries whose parent hasn't been walked yet
+
+    `total` sums their usage and `files` only that of those that aren't
+    directories; `time_ns` and `files_time_ns` hold the newest times of the
+    same, and `count` the number of entries beneath them, themselves included.
+    '''
+
+    __slots__ = ('total', 'files', 'time_ns', 'files_time_ns', 'count')
+
+    def __init__(self):
+        self.total = self.files = 0
+        self.time_ns = self.files_time_ns = 0
+        self.count = 0
+
+
+def fold(walk, top):
+    '''pair every entry of the post-order `walk` with the level holding what
+    was collected of its children, and the one of its own depth, to add to
+
+    Every entry comes after all of its children, so only one level per depth
+    is held, never the tree. `top` is the level of depth 0; the others are
+    made like it.
+
+    :type walk: iterator of (int, dirtree.entry.Entry)
+    :rtype: iterator of (int, dirtree.entry.Entry, object, object)
+    '''
+    make = type(top)
+    levels = [top]
+    for depth, entry in walk:
+        while len(levels) < depth + 2:
+            levels.append(make())
+
+        children, levels[depth + 1] = levels[depth + 1], make()
+        yield depth, entry, children, levels[depth]
+
+
+class Aggregator:
+    '''Folds the post-order stream of an `EntryWalker` into du style totals
+
+    A file with several hard links is counted once unless
+    `options.count_links` is set. Roots that can't be accessed or read are
+    reported and counted in `errors`.
+
+    :type options: dirtree.options.Options
+    :type files: [dirtree.entry.Entry] or None
+    '''
+
+    def __init__(self, options, files=None):
+        self.options = options
+        self.files = options.iter_files() if files is None else files
+        self.grand_total = 0
+        self.grand_time_ns = 0
+        # directories that couldn't be read, as reported by the walks
+        self.errors = 0
+        # the inodes of files with several links already counted
+        self.links = InodeSet()
+        # entries walked by every root, when following links
+        self.visited = None
+        if options.dereference and not options.count_links:
+            self.visited = InodeSet()
+        self.__shown = shown_filter(options, options.stats)
+
+    def __iter__(self):
+        jobs = self.options.jobs
+        prefetcher = None
+        if jobs and jobs > 1:
+            prefetcher = Prefetcher(jobs, stats=self.options.stats)
+        pool = self.__pool()
+
+        try:
+            files = self.__accessible(self.files)
+            # walking starts as the first names are read; a root nested in
+            # another is walked once and counted once in the grand total
+            for root in RootScheduler(files, prefetcher=prefetcher):
+                if pool is not None and self.__shardable(root):
+                    yield from self.__aggregate_sharded(root, pool)
+                else:
+                    yield from self.__aggregate_root(root, prefetcher)
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+            stats = self.options.stats
+            if stats is not None:
+                stats.links_tracked = self.links.count
+                stats.links_bytes = self.links.nbytes
+
+        if self.options.total:
+            time_ns = self.grand_time_ns if self.options.time_field else None
+            yield Total(None, self.grand_total, 0, time_ns)
+
+    def __accessible(self, files):
+        '''the `files` that exist; the others are reported and counted in
+        `errors`, as du does'''
+        for entry in files:
+            if entry.exists:
+                yield entry
+                continue
+
+            try:
+                # only to tell why
+                os.lstat(entry.path)
+            except OSError as exc:
+                self.errors += 1
+                print("dirtree: cannot access '%s': %s" % (
+                    entry.path, exc.strerror or exc), file=sys.stderr)
+            else:
+                yield Entry(entry.path)
+
+    def __aggregate_root(self, root, prefetcher):
+        if root.covered and root.total is not None:
+            # unless it was already listed by the walk that reached it
+            if not root.yielded and self.__visible(0, root.entry, root.shown):
+                root.yielded = True
+                yield Total(root.entry, root.shown, 0, root.shown_time_ns)
+            return
+
+        for inner in root.grafts.values():
+            # counted again as part of this root
+            self.grand_total -= inner.total
+
+        walker = EntryWalker(
+            self.options, root.entry, prefetcher=prefetcher,
+            stop=set(root.grafts) or None, visited=self.visited,
+        )
+        yield from self.aggregate(walker, root)
+
+    def __pool(self):
+        # workers that walk the subdirectories of directory roots, see
+        # `dirtree.shard`; what they can't carry stays in this process
+        options = self.options
+        processes = options.processes
+        if not processes or processes < 2:
+            return None
+
+        if options.dereference or options.cache or options.stats:
+            return None
+
+        if options.breakdown is not None or options.snapshot is not None:
+            return None
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        return ProcessPoolExecutor(processes)
+
+    def __shardable(self, root):
+        if root.covered or root.captures or root.grafts:
+            return False
+
+        return root.entry.is_dir and not root.entry.is_symlink
+
+    def __aggregate_sharded(self, root, pool):
+        '''aggregate the directory `root`, with each of its subdirectories
+        walked by a worker and merged back in walk order'''
+        from .shard import scan_shard, worker_args
+
+        options = self.options
+        entry = root.entry
+        time_field = options.time_field
+        separate_dirs = options.separate_dirs
+        descend = descend_filter(options, entry)
+
+        root.total = root.shown = root.time_ns = root.shown_time_ns = 0
+        if descend is not None and not descend(entry):
+            return
+
+        args = worker_args(options)
+        try:
+            with os.scandir(entry.path) as it:
+                children = iter([Entry(dir_entry) for dir_entry in it])
+        except OSError as exc:
+            # only its own usage is counted, as by `EntryWalker`
+            self.errors += 1
+            print("dirtree: cannot read directory '%s': %s" % (
+                entry.path, exc.strerror or exc), file=sys.stderr)
+            children = iter(())
+
+        # a few shards are kept in flight ahead of the one being merged
+        window = deque()
+        ahead = options.processes * 2
+
+        def fill():
+            while len(window) < ahead:
+                child = next(children, None)
+                if child is None:
+                    return
+
+                if descend is not None and not descend(child):
+                    continue
+
+                future = None
+                if child.is_dir:
+                    future = pool.submit(scan_shard, args, child.path)
+
+                window.append((child, future))
+
+        children_total = files_total = 0
+        children_ns = files_ns = 0
+
+        fill()
+        while window:
+            child, future = window.popleft()
+            fill()
+
+            if future is None:
+                if self.__linked_again(child):
+                    # counted and listed where it was first seen
+                    continue
+
+                own = self.size(child)
+                own_ns = getattr(child, time_field) if time_field else 0
+
+                children_total += own
+                files_total += own
+                children_ns = max(children_ns, own_ns)
+                files_ns = max(files_ns, own_ns)
+
+                if self.__visible(1, child, own):
+                    yield Total(child, own, 1, own_ns if time_field else None)
+                continue
+
+            shard = future.result()
+            shard.resolve(self.links, separate_dirs)
+            self.errors += shard.errors
+            children_total += shard.total
+            children_ns = max(children_ns, shard.time_ns)
+
+            for path, depth, size, time_ns, is_dir in shard.records():
+                if self.__shown(depth + 1, is_dir, size):
+                    yield Total(
+                        Entry(path), size, depth + 1,
+                        time_ns if time_field else None,
+                    )
+
+        own = self.size(entry)
+        own_ns = getattr(entry, time_field) if time_field else 0
+        total = own + children_total
+        time_ns = max(own_ns, children_ns)
+        if separate_dirs:
+            shown, shown_time_ns = own + files_total, max(own_ns, files_ns)
+        else:
+            shown, shown_time_ns = total, time_ns
+
+        if self.__visible(0, entry, shown):
+            root.yielded = True
+            yield Total(entry, shown, 0, shown_time_ns if time_field else None)
+
+        self.grand_total += total
+        self.grand_time_ns = max(self.grand_time_ns, time_ns)
+        root.total, root.shown = total, shown
+        root.time_ns, root.shown_time_ns = time_ns, shown_time_ns
+
+    def usage(self, entry):
+        '''the amount `entry` contributes on its own'''
+        if self.__linked_again(entry):
+            return 0
+
+        return self.size(entry)
+
+    def size(self, entry):
+        '''the amount `entry` contributes, hard links aside'''
+        if self.options.inodes:
+            return 1
+
+        if self.options.apparent_size:
+            return entry.size
+
+        return entry.disk_usage
+
+    def __linked_again(self, entry):
+        if self.options.count_links or entry.is_dir or entry.num_links < 2:
+            return False
+
+        return not self.links.add(entry.device, entry.inode)
+
+    def __visible(self, depth, entry, size):
+        return self.__shown(depth, entry.is_dir, size)
+
+    def aggregate(self, walker, root=None):
+        '''yield a `Total` for every visible entry of `walker`; with a `root`,
+        the totals of the roots it captures are recorded and the roots it
+        grafts are counted without being walked
+
+        :type walker: dirtree.walker.EntryWalker
+        :type root: dirtree.schedule.Root or None
+        '''
+        separate_dirs = self.options.separate_dirs
+        time_field = self.options.time_field
+        breakdown = self.options.breakdown
+        snapshot = self.options.snapshot
+        visible = self.__shown
+        captures = root.captures if root is not None else {}
+        grafts = root.grafts if root is not None else {}
+
+        top = Level()
+        shown = shown_time_ns = count = 0
+        shows = False
+
+        # the newest times are carried up as ints, only turned into text by the
+        # output; the breakdown and snapshot get whole subtrees whatever is
+        # shown
+        for depth, entry, children, level in fold(walker.walk(), top):
+            inner = grafts.get(entry.path) if grafts else None
+            if inner is not None:
+                # already walked and reported as a root of its own
+                level.total += inner.total
+                if inner.time_ns > level.time_ns:
+                    level.time_ns = inner.time_ns
+                level.count += inner.count
+                continue
+
+            if self.__linked_again(entry):
+                # counted and listed where it was first seen; a file has
+                # nothing beneath it to collect
+                continue
+
+            own = self.size(entry)
+            own_ns = getattr(entry, time_field) if time_field else 0
+            if breakdown is not None and not entry.is_dir:
+                breakdown.add(entry, own)
+
+            total = own + children.total
+            level.total += total
+
+            children_ns = children.time_ns
+            time_ns = own_ns if own_ns > children_ns else children_ns
+            if time_ns > level.time_ns:
+                level.time_ns = time_ns
+
+            if not entry.is_dir:
+                level.files += total
+                if time_ns > level.files_time_ns:
+                    level.files_time_ns = time_ns
+
+            if separate_dirs and entry.is_dir:
+                shown = own + children.files
+                shown_time_ns = max(own_ns, children.files_time_ns)
+            else:
+                shown, shown_time_ns = total, time_ns
+
+            if snapshot is not None:
+                count = children.count + 1
+                level.count += count
+                if entry.is_dir or not depth:
+                    snapshot.add(
+                        entry.path, total, count, entry.mtime_ns, entry.inode)
+
+            shows = visible(depth, entry.is_dir, shown)
+            if captures and entry.path in captures:
+                captured = captures[entry.path]
+                captured.total, captured.shown = total, shown
+                captured.time_ns, captured.shown_time_ns = time_ns, shown_time_ns
+                captured.count = count
+                captured.yielded = shows
+
+            if shows:
+                yield Total(
+                    entry, shown, depth, shown_time_ns if time_field else None)
+
+        self.errors += walker.errors
+        self.grand_total += top.total
+        if top.time_ns > self.grand_time_ns:
+            self.grand_time_ns = top.time_ns
+
+        if root is not None:
+            # the root is the last entry walked
+            root.total, root.shown = top.total, shown
+            root.time_ns, root.shown_time_ns = top.time_ns, shown_time_ns
+            root.count = top.count
+            root.yielded = shows
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+
+from .aggregate import Aggregator
+from .walker import EntryWalker
+
+_DONE = object()
+
+
+class _Producer:
+    '''Runs a blocking iterator on an executor thread and hands its items to
+    the event loop in batches
+
+    At most `max_pending` batches wait in the queue; past that the thread
+    blocks until the loop catches up, so a slow consumer holds the walk back
+    instead of letting it run ahead in memory.
+    '''
+
+    def __init__(self, factory, executor=None, max_pending=8, batch_size=256):
+        self.factory = factory
+        self.executor = executor
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.max_pending)
+        stop = threading.Event()
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def produce():
+            iterable = self.factory()
+            batch = []
+            try:
+                for item in iterable:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        if stop.is_set():
+                            return
+
+                        put(batch)
+                        batch = []
+
+                if batch and not stop.is_set():
+                    put(batch)
+            except BaseException as exc:
+                if not stop.is_set():
+                    put(exc)
+                return
+            finally:
+                close = getattr(iterable, 'close', None)
+                if close is not None:
+                    close()
+
+            if not stop.is_set():
+                put(_DONE)
+
+        future = loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is _DONE:
+                    break
+
+                if isinstance(batch, BaseException):
+                    raise batch
+
+                for item in batch:
+                    yield item
+        finally:
+            stop.set()
+            # let a put waiting on a full queue through, the thread then sees
+            # `stop` and finishes
+            while not queue.empty():
+                queue.get_nowait()
+
+            await future
+
+
+class AsyncEntryWalker:
+    '''`EntryWalker` for `async for`, without blocking the event loop
+
+    The walk, and with it every `scandir` and `lstat`, runs on a thread of
+    `executor` (the loop's default executor if not given); with `jobs` (or
+    `options.jobs`) greater than one, directories are also listed ahead on
+    that many threads. Entries cross over to the loop `batch_size` at a time,
+    and at most `max_pending` batches are buffered before the walk waits for
+    the consumer.
+
+    Iterating yields the entries `EntryWalker` would, filtered by
+    `options.threshold`; `walk` yields `(depth, entry)` for every entry.
+
+    :type options: dirtree.options.Options
+    :type entry: dirtree.entry.Entry
+    :type executor: concurrent.futures.Executor or None
+    :type max_pending: int
+    :type batch_size: int
+    '''
+
+    def __init__(self, options, entry, executor=None, max_pending=8,
+                 batch_size=256, **kwargs):
+        self.options = options
+        self.entry = entry
+        self.executor = executor
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.kwargs = kwargs
+
+    def __walker(self):
+        return EntryWalker(self.options, self.entry, **self.kwargs)
+
+    def __producer(self, factory):
+        return _Producer(
+            factory, self.executor, self.max_pending, self.batch_size)
+
+    def __aiter__(self):
+        return self.__producer(self.__iter_entries).__aiter__()
+
+    def __iter_entries(self):
+        walker = self.__walker()
+        try:
+            yield from walker
+        finally:
+            walker.close()
+
+    def walk(self):
+        '''asynchronously yield `(depth, entry)` for every walked entry, see
+        `EntryWalker.walk`'''
+        return self.__producer(self.__iter_walk).__aiter__()
+
+    def __iter_walk(self):
+        walker = self.__walker()
+        try:
+            yield from walker.walk()
+        finally:
+            walker.close()
+
+
+class AsyncAggregator:
+    '''`Aggregator` for `async for`: yields the same `Total` records, computed
+    on a thread of `executor`
+
+    :type options: dirtree.options.Options
+    :type files: [dirtree.entry.Entry] or None
+    :type executor: concurrent.futures.Executor or None
+    :type max_pending: int
+    :type batch_size: int
+    '''
+
+    def __init__(self, options, files=None, executor=None, max_pending=8,
+                 batch_size=256):
+        self.aggregator = Aggregator(options, files)
+        self.executor = executor
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+
+    @property
+    def grand_total(self):
+        return self.aggregator.grand_total
+
+    def __aiter__(self):
+        producer = _Producer(
+            self.aggregator.__iter__, self.executor, self.max_pending,
+            self.batch_size,
+        )
+        return producer.__aiter__()
@@ -0,0 +1,106 @@
+import os
+import time
+from bisect import bisect_right
+
+#: the groupings `Breakdown` can collect
+GROUPS = ('ext', 'uid', 'gid', 'age')
+
+_DAY_NS = 24 * 60 * 60 * 10 ** 9
+
+#: upper bounds of the age buckets, in days, and their labels
+AGE_BUCKETS = (
+    (1, '<1d'),
+    (7, '1d-7d'),
+    (30, '7d-30d'),
+    (90, '30d-90d'),
+    (365, '90d-1y'),
+    (730, '1y-2y'),
+    (None, '>2y'),
+)
+
+
+def parse_groups(string):
+    '''parse a comma separated list of `GROUPS`, e.g., `ext,age`, or `all`'''
+    groups = tuple(group.strip() for group in string.split(',') if group.strip())
+    if not groups or groups == ('all', ):
+        return GROUPS
+
+    unknown = [group for group in groups if group not in GROUPS]
+    if unknown:
+        raise ValueError('unknown groups: %s' % ', '.join(unknown))
+
+    return groups
+
+
+class Breakdown:
+    '''Sizes and file counts of the walked files grouped by extension, owner,
+    group and modification age, collected as the files are aggregated
+
+    Only files (every entry but directories) are grouped, with the amount
+    they contribute to the totals, so a hard linked file is counted once.
+    Ages are measured from `now`, in nanoseconds since the epoch, which
+    defaults to when the breakdown is created.
+
+    :type groups: (str)
+    :type now: int or None
+    '''
+
+    def __init__(self, groups=GROUPS, now=None):
+        self.groups = tuple(groups)
+        self.now = time.time_ns() if now is None else now
+        self.counts = {group: {} for group in self.groups}
+
+        self.__ext = self.counts.get('ext')
+        self.__uid = self.counts.get('uid')
+        self.__gid = self.counts.get('gid')
+        self.__age = self.counts.get('age')
+
+        # entries modified after `cutoffs[i]` are in bucket `i`, youngest first
+        self.__cutoffs = [
+            -(self.now - days * _DAY_NS)
+            for days, _ in AGE_BUCKETS if days is not None
+        ]
+
+    @staticmethod
+    def __count(counts, key, size):
+        try:
+            item = counts[key]
+        except KeyError:
+            counts[key] = [size, 1]
+        else:
+            item[0] += size
+            item[1] += 1
+
+    def add(self, entry, size):
+        '''count the file `entry` as `size`
+
+        :type entry: dirtree.entry.Entry
+        :type size: int
+        '''
+        if self.__ext is not None:
+            ext = os.path.splitext(entry.name)[1].lower()
+            self.__count(self.__ext, ext, size)
+
+        if self.__uid is not None:
+            self.__count(self.__uid, entry.uid, size)
+
+        if self.__gid is not None:
+            self.__count(self.__gid, entry.gid, size)
+
+        if self.__age is not None:
+            bucket = bisect_right(self.__cutoffs, -entry.mtime_ns)
+            self.__count(self.__age, AGE_BUCKETS[bucket][1], size)
+
+    def rows(self):
+        '''yield `(group, key, size, files)`, largest first within a group and
+        ages from the youngest'''
+        for group in self.groups:
+            counts = self.counts[group]
+            if group == 'age':
+                keys = [label for _, label in AGE_BUCKETS if label in counts]
+            else:
+                keys = sorted(counts, key=lambda key: (-counts[key][0], key))
+
+            for key in keys:
+                size, files = counts[key]
+                yield group, key, size, files
@@ -0,0 +1,140 @@
+import marshal
+import os
+import sqlite3
+
+from .entry import Entry
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS listing (
+    path TEXT PRIMARY KEY,
+    device INTEGER,
+    inode INTEGER,
+    mtime_ns INTEGER,
+    ctime_ns INTEGER,
+    children BLOB
+)
+'''
+
+
+def _key(entry):
+    return (entry.device, entry.inode, entry.mtime_ns, entry.ctime_ns)
+
+
+class ScanCache:
+    '''An on-disk index of directory listings from a previous scan
+
+    Each directory is recorded with its `(st_dev, st_ino, st_mtime_ns,
+    st_ctime_ns)` and the stat fields of its children. On the next scan, a
+    directory whose own metadata is unchanged is not listed again; its
+    children are still stat'd, since a file modified in place doesn't change
+    its directory, and subdirectories are checked the same way.
+
+    The listings seen during a scan are written to a new index, in a file of
+    its own, that replaces the old one on `close`, so directories that
+    disappeared are dropped and concurrent scans don't clash.
+
+    :type path: str
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self.previous = None
+        if os.path.exists(path):
+            self.previous = sqlite3.connect(path)
+
+        import tempfile
+
+        fd, self.__next_path = tempfile.mkstemp(
+            '.new', os.path.basename(path) + '.',
+            os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+
+        self.current = sqlite3.connect(self.__next_path)
+        self.current.execute('PRAGMA journal_mode = OFF')
+        self.current.execute('PRAGMA synchronous = OFF')
+        self.current.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __find(self, entry):
+        if self.previous is None or not entry.exists:
+            return None
+
+        try:
+            row = self.previous.execute(
+                'SELECT device, inode, mtime_ns, ctime_ns, children '
+                'FROM listing WHERE path = ?', (entry.path, )
+            ).fetchone()
+        except sqlite3.DatabaseError:
+            return None
+
+        if row is None or tuple(row[:4]) != _key(entry):
+            return None
+
+        return row[4]
+
+    def is_fresh(self, entry):
+        '''whether the cached listing of the directory `entry` is still valid'''
+        return self.__find(entry) is not None
+
+    def lookup(self, entry, at=None):
+        '''the children of the directory `entry` from the cache, or `None` if it
+        has to be listed again; the children are stat'd by name in `at`, the
+        directory open, if given
+
+        :rtype: [dirtree.entry.Entry] or None
+        '''
+        blob = self.__find(entry)
+        if blob is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__save(entry, blob)
+
+        # only the listing is reused, the children are stat'd again
+        return [
+            Entry(os.path.join(entry.path, name), at=at)
+            for name, _ in marshal.loads(blob)
+        ]
+
+    def store(self, entry, children):
+        '''record the listing of the directory `entry`
+
+        :type children: [dirtree.entry.Entry]
+        '''
+        if not entry.exists:
+            return
+
+        blob = marshal.dumps([
+            (child.name, child.fields()) for child in children if child.exists
+        ])
+        self.__save(entry, blob)
+
+    def __save(self, entry, blob):
+        self.current.execute(
+            'INSERT OR REPLACE INTO listing VALUES (?, ?, ?, ?, ?, ?)',
+            (entry.path, ) + _key(entry) + (blob, ),
+        )
+
+    def close(self):
+        '''write the new index over the old one'''
+        if self.current is None:
+            return
+
+        self.current.commit()
+        self.current.close()
+        self.current = None
+
+        if self.previous is not None:
+            self.previous.close()
+            self.previous = None
+
+        os.replace(self.__next_path, self.path)
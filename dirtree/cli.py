@@ -1,10 +1,15 @@
 import argparse
-from pprint import pprint
+import os
+import sys
+from functools import lru_cache
 
+from .aggregate import Aggregator
+from .breakdown import parse_groups
 from .constants import DESCRIPTION, EPILOG
 from .options import Options
-from .size_type import parse_size_type
-from .walker import EntryWalker
+from .output import FORMATS, OutputWriter
+from .size_type import parse_size_type, size_suffix
+from .top import TOP_KEYS, TopN
 
 
 class MetaAction(argparse.Action):
@@ -18,6 +23,66 @@ class SetBytesAction(MetaAction):
     def __call__(self, parser, namespace, values, option_string=None):
         setattr(namespace, 'apparent_size', True)
         setattr(namespace, 'block_size', 1)
+        setattr(namespace, 'block_suffix', '')
+
+
+class BlockSizeAction(argparse.Action):
+    '''sets `block_size` and `block_suffix` from a SIZE; given a `const`, as
+    for `-k` and `-m`, that SIZE without an argument'''
+
+    def __init__(self, *args, **kwargs):
+        if kwargs.get('const') is not None:
+            kwargs['nargs'] = 0
+        super().__init__(*args, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        if self.const is not None:
+            values = self.const
+
+        try:
+            setattr(namespace, self.dest, parse_size_type(values))
+        except argparse.ArgumentTypeError as exc:
+            raise argparse.ArgumentError(self, str(exc))
+
+        setattr(namespace, 'block_suffix', size_suffix(values))
+
+
+class HelpFormatter(argparse.RawDescriptionHelpFormatter):
+    '''`RawDescriptionHelpFormatter` sized from the terminal without `shutil`
+
+    argparse makes a formatter for every argument it adds, and the default one
+    imports `shutil` (and with it the compression modules) just to read the
+    terminal width.
+    '''
+
+    def __init__(self, prog, width=None, **kwargs):
+        if width is None:
+            width = terminal_width() - 2
+
+        super().__init__(prog, width=width, **kwargs)
+
+
+def terminal_width():
+    '''the columns of the terminal, as `shutil.get_terminal_size` finds them'''
+    try:
+        columns = int(os.environ['COLUMNS'])
+    except (KeyError, ValueError):
+        columns = 0
+
+    if columns <= 0:
+        try:
+            columns = os.get_terminal_size(sys.__stdout__.fileno()).columns
+        except (AttributeError, ValueError, OSError):
+            columns = 0
+
+    return columns or 80
+
+
+def parse_breakdown(string):
+    try:
+        return parse_groups(string)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
 
 
 def parse_time_style(string):
@@ -25,7 +90,7 @@ def parse_time_style(string):
         return string[1:]
 
     if string == 'full-iso':
-        return '%F %T.%f %z'
+        return '%F %T.%N %z'
 
     if string == 'long-iso':
         return '%F %R'
@@ -36,215 +101,428 @@ def parse_time_style(string):
     raise argparse.ArgumentTypeError('Invalid style "%s"' % (string, ))
 
 
-parser = argparse.ArgumentParser(
-    description=DESCRIPTION,
-    epilog=EPILOG,
-    formatter_class=argparse.RawDescriptionHelpFormatter,
-    add_help=False,
-)
-
-parser.add_argument(
-    '-0', '--null',
-    action='store_true',
-    help='end each output line with NUL, not newline',
-)
-
-parser.add_argument(
-    '-a', '--all',
-    action='store_true',
-    help='write counts for all files, not just directories',
-)
-
-parser.add_argument(
-    '--apparent-size',
-    action='store_true',
-    help='print apparent sizes, rather than disk usage; although the apparent '
-    "size is usually smaller, it may be larger due to holes in ('sparse') "
-    'files, internal fragmentation, indirect blocks, and the like'
-)
-
-parser.add_argument(
-    '-B', '--block-size',
-    type=parse_size_type,
-    default='',
-    help="scale sizes by SIZE before printing them; e.g., '-BM' prints sizes in "
-    'units of 1,048,576 bytes; see SIZE format below',
-    metavar='SIZE',
-)
-
-parser.add_argument(
-    '-b', '--bytes',
-    action=SetBytesAction,
-    help="equivalent to '--apparent-size --block-size=1'",
-)
-
-parser.add_argument(
-    '-c', '--total',
-    action='store_true',
-    help='produce a grand total',
-)
-
-parser.add_argument(
-    '-H', '-D', '--dereference-args',
-    action='store_true',
-    help='dereference only symlinks that are listed on the command line',
-)
-
-parser.add_argument(
-    '-d', '--max-depth',
-    type=int,
-    help='print the total for a directory (or file, with --all) only if it is '
-    'in N or fewer levels below the command line argument; --max-depth=0 is the '
-    'same as --summarize',
-    metavar='N',
-)
-
-parser.add_argument(
-    '--files0-from',
-    type=argparse.FileType('rb'),
-    help='summarize disk usage of the NUL-terminated file names specified in '
-    'file F; if F is -, then read names from standard input',
-    metavar='F',
-)
-
-parser.add_argument(
-    '-h', '--human-readable',
-    action='store_true',
-    help='print sizes in human readable format (e.g., 1K 234M 2G)'
-)
-
-parser.add_argument(
-    '--inodes',
-    action='store_true',
-    help='list inode usage information instead of block usage'
-)
-
-parser.add_argument(
-    '-k',
-    action='store_const',
-    const=parse_size_type('1K'),
-    dest='block_size',
-    help='like --block-size=1K',
-)
-
-parser.add_argument(
-    '-L', '--dereference',
-    action='store_true',
-    help='dereference all symbolic links',
-)
-
-parser.add_argument(
-    '-l', '--count-links',
-    action='store_true',
-    help='count sizes many times if hard linked',
-)
-
-parser.add_argument(
-    '-m',
-    action='store_const',
-    const=parse_size_type('1M'),
-    dest='block_size',
-    help='like --block-size=1M',
-)
-
-parser.add_argument(
-    '-P', '--no-dereference',
-    action='store_false',
-    default=False,
-    dest='dereference',
-    help="don't follow any symbolic links (this is the default)",
-)
-
-parser.add_argument(
-    '-S', '--separate-dirs',
-    action='store_true',
-    help='for directories, do not include size of subdirectories',
-)
-
-parser.add_argument(
-    '--si',
-    action='store_true',
-    help='like -h, but uses powers of 1000 not 1024',
-)
-
-parser.add_argument(
-    '-s', '--summarize',
-    action='store_const',
-    const=0,
-    dest='max_depth',
-    help='display only a total for each argument',
-)
-
-parser.add_argument(
-    '-t', '--threshold',
-    type=parse_size_type,
-    help='exclude entries smaller than SIZE if positive, or entries greater than '
-    'SIZE if negative',
-    metavar='SIZE',
-)
-
-parser.add_argument(
-    '--time',
-    nargs='?',
-    const=True,
-    choices=('atime', 'access', 'use', 'ctime', 'status'),
-    help='show time of the last modification of any file in the directory, or '
-    'any of its subdirectories; show time as WORD instead of modification time: '
-    'atime, access, use, ctime, or status',
-    metavar='WORD'
-)
-
-parser.add_argument(
-    '--time-style',
-    type=parse_time_style,
-    default='long-iso',
-    help='show times using STYLE, which can be: full-iso, long-iso, iso, or '
-    '+FORMAT; FORMAT is interpreted as in `strftime`',
-    metavar='STYLE',
-)
-
-parser.add_argument(
-    '-X', '--exclude-from',
-    type=argparse.FileType(),
-    help='exclude files that match any pattern in FILE',
-    metavar='FILE',
-)
-
-parser.add_argument(
-    '--exclude',
-    action='append',
-    help='exclude files that match PATTERN',
-    metavar='PATTERN',
-)
-
-parser.add_argument(
-    '-x', '--one-file-system',
-    action='store_true',
-    help='skip directories on a different file system',
-)
-
-parser.add_argument(
-    'files',
-    nargs='*',
-    metavar='FILE',
-)
-
-parser.add_argument(
-    '--help',
-    action='help',
-    help='display this help and exit'
-)
+@lru_cache(maxsize=None)
+def build_parser():
+    '''the argument parser of `main`, built on first use'''
+    parser = argparse.ArgumentParser(
+        description=DESCRIPTION,
+        epilog=EPILOG,
+        formatter_class=HelpFormatter,
+        add_help=False,
+    )
+
+    parser.add_argument(
+        '-0', '--null',
+        action='store_true',
+        help='end each output line with NUL, not newline',
+    )
+
+    parser.add_argument(
+        '-a', '--all',
+        action='store_true',
+        help='write counts for all files, not just directories',
+    )
+
+    parser.add_argument(
+        '--apparent-size',
+        action='store_true',
+        help='print apparent sizes, rather than disk usage; although the '
+        'apparent size is usually smaller, it may be larger due to holes in '
+        "('sparse') files, internal fragmentation, indirect blocks, and the "
+        'like'
+    )
+
+    parser.add_argument(
+        '-B', '--block-size',
+        action=BlockSizeAction,
+        default='',
+        help="scale sizes by SIZE before printing them; e.g., '-BM' prints "
+        'sizes in units of 1,048,576 bytes; see SIZE format below',
+        metavar='SIZE',
+    )
+
+    parser.add_argument(
+        '-b', '--bytes',
+        action=SetBytesAction,
+        help="equivalent to '--apparent-size --block-size=1'",
+    )
+
+    parser.add_argument(
+        '--breakdown',
+        type=parse_breakdown,
+        help='after the totals, summarize the size and number of files by '
+        'any of ext (extension), uid, gid and age (since the last '
+        'modification), as a comma separated list, or all; collected in the '
+        'same walk',
+        metavar='GROUPS',
+    )
+
+    parser.add_argument(
+        '--cache',
+        help='reuse the directory listings saved in FILE by a previous scan '
+        'for directories that have not changed since, and save this scan to '
+        'FILE',
+        metavar='FILE',
+    )
+
+    parser.add_argument(
+        '-c', '--total',
+        action='store_true',
+        help='produce a grand total',
+    )
+
+    parser.add_argument(
+        '--diff',
+        nargs=2,
+        help='instead of scanning, compare the snapshots OLD and NEW saved '
+        'by --snapshot and list the directories that changed in size or '
+        'number of entries, largest growth first; --top and --threshold '
+        'apply to the growth',
+        metavar=('OLD', 'NEW'),
+    )
+
+    parser.add_argument(
+        '--format',
+        choices=FORMATS,
+        default='du',
+        help='write records as du lines (the default), JSON lines, CSV, or '
+        'packed: a compact binary file of the totals with the stat fields of '
+        'each entry, read with dirtree.packed.PackedReader',
+        metavar='FORMAT',
+    )
+
+    parser.add_argument(
+        '-H', '-D', '--dereference-args',
+        action='store_true',
+        help='dereference only symlinks that are listed on the command line',
+    )
+
+    parser.add_argument(
+        '-d', '--max-depth',
+        type=int,
+        help='print the total for a directory (or file, with --all) only if '
+        'it is in N or fewer levels below the command line argument; '
+        '--max-depth=0 is the same as --summarize',
+        metavar='N',
+    )
+
+    parser.add_argument(
+        '--files0-from',
+        type=argparse.FileType('rb'),
+        help='summarize disk usage of the NUL-terminated file names '
+        'specified in file F; if F is -, then read names from standard input',
+        metavar='F',
+    )
+
+    parser.add_argument(
+        '-h', '--human-readable',
+        action='store_true',
+        help='print sizes in human readable format (e.g., 1K 234M 2G)'
+    )
+
+    parser.add_argument(
+        '--inodes',
+        action='store_true',
+        help='list inode usage information instead of block usage'
+    )
+
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='list directories on N threads; output order is unchanged',
+        metavar='N',
+    )
+
+    parser.add_argument(
+        '-k',
+        action=BlockSizeAction,
+        const='1K',
+        dest='block_size',
+        help='like --block-size=1K',
+    )
+
+    parser.add_argument(
+        '-L', '--dereference',
+        action='store_true',
+        help='dereference all symbolic links',
+    )
+
+    parser.add_argument(
+        '-l', '--count-links',
+        action='store_true',
+        help='count sizes many times if hard linked',
+    )
+
+    parser.add_argument(
+        '-m',
+        action=BlockSizeAction,
+        const='1M',
+        dest='block_size',
+        help='like --block-size=1M',
+    )
+
+    parser.add_argument(
+        '--max-open-dirs',
+        type=int,
+        help='hold at most N directories open while walking; deeper trees '
+        'read outer directories to completion and close them early',
+        metavar='N',
+    )
+
+    parser.add_argument(
+        '-P', '--no-dereference',
+        action='store_false',
+        default=False,
+        dest='dereference',
+        help="don't follow any symbolic links (this is the default)",
+    )
+
+    parser.add_argument(
+        '--processes',
+        type=int,
+        help='walk the subdirectories of each FILE in N worker processes; '
+        'output is unchanged',
+        metavar='N',
+    )
+
+    parser.add_argument(
+        '-S', '--separate-dirs',
+        action='store_true',
+        help='for directories, do not include size of subdirectories',
+    )
+
+    parser.add_argument(
+        '--si',
+        action='store_true',
+        help='like -h, but uses powers of 1000 not 1024',
+    )
+
+    parser.add_argument(
+        '--snapshot',
+        help='save the size and number of entries of every directory of this '
+        'scan to FILE, to be compared with --diff',
+        metavar='FILE',
+    )
+
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='time the system calls, exclude matching and output of the scan '
+        'and report them, with the slowest directories, on standard error',
+    )
+
+    parser.add_argument(
+        '-s', '--summarize',
+        action='store_const',
+        const=0,
+        dest='max_depth',
+        help='display only a total for each argument',
+    )
+
+    parser.add_argument(
+        '-t', '--threshold',
+        type=parse_size_type,
+        help='exclude entries smaller than SIZE if positive, or entries '
+        'greater than SIZE if negative',
+        metavar='SIZE',
+    )
+
+    parser.add_argument(
+        '--time',
+        nargs='?',
+        const=True,
+        choices=('atime', 'access', 'use', 'ctime', 'status'),
+        help='show time of the last modification of any file in the '
+        'directory, or any of its subdirectories; show time as WORD instead '
+        'of modification time: atime, access, use, ctime, or status',
+        metavar='WORD'
+    )
+
+    parser.add_argument(
+        '--time-style',
+        type=parse_time_style,
+        default='long-iso',
+        help='show times using STYLE, which can be: full-iso, long-iso, iso, '
+        'or +FORMAT; FORMAT is interpreted as in `strftime`',
+        metavar='STYLE',
+    )
+
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='keep running and print the new totals whenever files change '
+        '(Linux only)',
+    )
+
+    parser.add_argument(
+        '--top',
+        type=int,
+        help='only list the N largest entries, largest first; memory stays '
+        'bound by N however many entries are walked',
+        metavar='N',
+    )
+
+    parser.add_argument(
+        '--top-by',
+        choices=tuple(TOP_KEYS),
+        default='size',
+        help='rank --top by size (an inode count with --inodes, the default) '
+        'or by the newest modification time, or WORD of --time',
+        metavar='KEY',
+    )
+
+    parser.add_argument(
+        '-X', '--exclude-from',
+        type=argparse.FileType(),
+        help='exclude files that match any pattern in FILE',
+        metavar='FILE',
+    )
+
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        help='exclude files that match PATTERN',
+        metavar='PATTERN',
+    )
+
+    parser.add_argument(
+        '-x', '--one-file-system',
+        action='store_true',
+        help='skip directories on a different file system',
+    )
+
+    parser.add_argument(
+        'files',
+        nargs='*',
+        metavar='FILE',
+    )
+
+    parser.set_defaults(block_suffix='')
+
+    parser.add_argument(
+        '--help',
+        action='help',
+        help='display this help and exit'
+    )
+
+    return parser
+
+
+def __getattr__(name):
+    # `parser` is kept as a module attribute, without building it on import
+    if name == 'parser':
+        return build_parser()
+
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def watch(args):
+    from .watch import Watcher
+
+    watcher = Watcher(args)
+    writer = OutputWriter(args)
+    try:
+        for total in watcher:
+            writer.write(total)
+            writer.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        if args.cache is not None:
+            args.cache.close()
+
+
+def diff(args):
+    from .snapshot import Snapshot, by_growth, diff as diff_snapshots
+
+    parser = build_parser()
+    old_path, new_path = args.diff
+    try:
+        old, new = Snapshot(old_path), Snapshot(new_path)
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+
+    with old, new:
+        if old.unit != new.unit:
+            parser.error('%s has sizes in %s, %s in %s' % (
+                old_path, old.unit, new_path, new.unit))
+
+        changes = diff_snapshots(old, new)
+        thresh = args.threshold
+        if thresh is not None and thresh < 0:
+            changes = (c for c in changes if abs(c.size) <= -thresh)
+        elif thresh is not None:
+            changes = (c for c in changes if abs(c.size) >= thresh)
+
+        with OutputWriter(args, header=False) as writer:
+            writer.write_changes(by_growth(changes, args.top), new.unit)
 
 
 def main(args=None):
-    args = Options(parser.parse_args(args))
+    parser = build_parser()
+    try:
+        args = Options(parser.parse_args(args))
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    if args.format == 'packed':
+        if args.diff or args.watch or args.breakdown is not None:
+            parser.error('--format packed only holds the totals of a scan')
+
+    if args.watch and args.dereference:
+        parser.error('--watch cannot follow symbolic links (-L)')
+
+    try:
+        if args.diff:
+            return diff(args)
+
+        if args.watch:
+            return watch(args)
+
+        return scan(args)
+    except BrokenPipeError:
+        # the reader went away, as `head` does; stop without a word, with the
+        # status of a process killed by SIGPIPE, and keep the interpreter from
+        # failing to flush stdout again on exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+
+        import signal
+
+        return 128 + signal.SIGPIPE
+
+
+def scan(args):
+    stats = args.stats
+    if stats is not None:
+        stats.start()
+
+    aggregator = totals = Aggregator(args)
+    if args.top:
+        totals = TopN(args.top, args.top_by).extend(totals)
+
+    with OutputWriter(args) as writer:
+        for total in totals:
+            writer.write(total)
+
+        if args.breakdown is not None:
+            writer.write_breakdown(args.breakdown)
+
+    if args.cache is not None:
+        args.cache.close()
+
+    if args.snapshot is not None:
+        args.snapshot.close()
 
-    # pprint(args)
+    if stats is not None:
+        stats.stop()
+        stats.report()
 
-    for file in args.files:
-        for entry in EntryWalker(args, file):
-            pprint(entry)
+    # as du, unreadable directories are reported and the scan carries on
+    return 1 if aggregator.errors else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -13,6 +13,12 @@ PREFIXES = OrderedDict((
     ('Y', 8),
 ))
 
+DEFAULT_BUF_SIZE = 1024 * 1024
+
+DEFAULT_MAX_OPEN_DIRS = 64
+
+DEFAULT_ROOT_WINDOW = 4096
+
 DESCRIPTION = '''\
     Summarize disk usage of the set of FILEs, recursively for directories.
 '''
@@ -1,40 +1,179 @@
 import os
 import stat
+import time
 
 from .constants import STAT_FMT_TYPE
 from .mixins import FieldsMixin
 from .utils import local_timestamp, strftime
 
 
+_STAT_FIELDS = (
+    'mode', 'inode', 'device', 'num_links', 'uid', 'gid', 'size', 'blocks',
+    'atime_ns', 'mtime_ns', 'ctime_ns',
+)
+
+_TIME_FIELDS = {
+    'atime': 'atime_ns',
+    'mtime': 'mtime_ns',
+    'ctime': 'ctime_ns',
+}
+
 class Entry(FieldsMixin):
+    '''A file system entry whose `lstat` is only performed when a field that
+    needs it is read; names and file types come from the directory listing
+
+    Entries are slotted: the stat fields are unpacked into plain ints on first
+    use and the `os.DirEntry` is released, and the `atime`, `mtime` and `ctime`
+    datetimes are built once and kept.
+
+    An entry listed from an open directory `at` (anything with an `fd` and
+    `stats`) is stat'd by name relative to it, so its `path` may be longer
+    than `PATH_MAX`, and timed in `at.stats` unless that is `None`; `at` is
+    held until then.
+    '''
+
+    __slots__ = (
+        'name', 'path', 'exists', '_dir_entry', '_at', '_loaded', '_readlink',
+    ) + _STAT_FIELDS + tuple(_TIME_FIELDS)
+
     __repr_fields__ = (
         'name', 'path', 'exists', 'type', 'is_dir', 'is_file', 'is_symlink',
         'readlink', ('mode', stat.filemode), ('device', hex), ('inode', hex),
-        'num_links', 'uid', 'gid', 'size', ('atime', strftime),
+        'num_links', 'uid', 'gid', 'size', 'blocks', ('atime', strftime),
         ('mtime', strftime), ('ctime', strftime),
     )
 
-    def __init__(self, dir_entry):
-        if isinstance(dir_entry, (Entry, os.DirEntry)):
+    def __init__(self, dir_entry, path=None, at=None):
+        self._loaded = False
+        self._at = at
+
+        if isinstance(dir_entry, Entry):
+            for attr in Entry.__slots__:
+                try:
+                    value = object.__getattribute__(dir_entry, attr)
+                except AttributeError:
+                    pass
+                else:
+                    setattr(self, attr, value)
+        elif isinstance(dir_entry, os.DirEntry):
             self.name = dir_entry.name
-            self.path = dir_entry.path
-            st = dir_entry.stat
-            if callable(st):
-                self.stat = st(follow_symlinks=False)
-            else:
-                self.stat = st
+            # listed from a file descriptor, its own path is only the name
+            self.path = dir_entry.path if path is None else path
+            # it was just listed by its parent directory
+            self.exists = True
+            self._dir_entry = dir_entry
         else:
             self.name = os.path.basename(dir_entry)
             self.path = dir_entry
-            try:
-                self.stat = os.lstat(dir_entry)
-            except OSError:
-                self.stat = None
+            self._dir_entry = None
 
-    def __bool__(self):
-        return bool(self.stat)
+    @classmethod
+    def restore(cls, path, fields):
+        '''an existing entry at `path` whose stat fields were saved by `fields`
+        and are not read again'''
+        entry = cls(path)
+        entry._loaded = True
+        entry.exists = True
+        for attr, value in zip(_STAT_FIELDS, fields):
+            setattr(entry, attr, value)
+
+        return entry
+
+    def fields(self):
+        '''the stat fields as a tuple of ints, see `restore`'''
+        self.lstat()
+        return tuple(getattr(self, attr) for attr in _STAT_FIELDS)
+
+    def __getattr__(self, attr):
+        # only called for slots that haven't been filled in yet
+        if attr in _TIME_FIELDS:
+            ns = getattr(self, _TIME_FIELDS[attr])
+            value = self.exists and local_timestamp(ns / 1e9)
+            setattr(self, attr, value)
+            return value
+
+        if attr in _STAT_FIELDS or attr == 'exists':
+            self.lstat()
+            return object.__getattribute__(self, attr)
+
+        raise AttributeError(attr)
+
+    def lstat(self):
+        '''perform the `lstat` if it hasn't been yet; returns whether the entry
+        exists
+
+        :rtype: bool
+        '''
+        if self._loaded:
+            return self.exists
 
-    exists = property(__bool__)
+        stats = self._at.stats if self._at is not None else None
+        if stats is not None:
+            start = time.perf_counter()
+
+        try:
+            if self._dir_entry is not None:
+                st = self._dir_entry.stat(follow_symlinks=False)
+            elif self._at is not None:
+                st = os.lstat(self.name, dir_fd=self._at.fd)
+            else:
+                st = os.lstat(self.path)
+        except OSError:
+            st = None
+
+        if stats is not None:
+            stats.record('lstat', start)
+
+        self._loaded = True
+        self._dir_entry = None
+        self._at = None
+
+        if st is None:
+            self.exists = False
+            for attr in _STAT_FIELDS:
+                setattr(self, attr, False)
+        else:
+            self.exists = True
+            self.mode = st.st_mode
+            self.inode = st.st_ino
+            self.device = st.st_dev
+            self.num_links = st.st_nlink
+            self.uid = st.st_uid
+            self.gid = st.st_gid
+            self.size = st.st_size
+            self.blocks = st.st_blocks
+            self.atime_ns = st.st_atime_ns
+            self.mtime_ns = st.st_mtime_ns
+            self.ctime_ns = st.st_ctime_ns
+
+        return self.exists
+
+    @property
+    def stat(self):
+        '''the stat fields as an `os.stat_result`; `None` if the entry is gone
+
+        :rtype: os.stat_result or None
+        '''
+        if not self.lstat():
+            return None
+
+        times = (self.atime_ns, self.mtime_ns, self.ctime_ns)
+        return os.stat_result(
+            (self.mode, self.inode, self.device, self.num_links, self.uid,
+             self.gid, self.size) + tuple(ns // 10 ** 9 for ns in times),
+            {
+                'st_atime': times[0] / 1e9,
+                'st_mtime': times[1] / 1e9,
+                'st_ctime': times[2] / 1e9,
+                'st_atime_ns': times[0],
+                'st_mtime_ns': times[1],
+                'st_ctime_ns': times[2],
+                'st_blocks': self.blocks,
+            },
+        )
+
+    def __bool__(self):
+        return self.exists
 
     @property
     def type(self):
@@ -42,16 +181,32 @@ class Entry(FieldsMixin):
             fmt = stat.S_IFMT(self.mode)
             return STAT_FMT_TYPE[fmt]
 
+    def __dir_entry_is(self, method):
+        # answered from `d_type` where the file system provides it
+        try:
+            return method(follow_symlinks=False)
+        except OSError:
+            return False
+
     @property
     def is_dir(self):
+        if self._dir_entry is not None:
+            return self.__dir_entry_is(self._dir_entry.is_dir)
+
         return self.exists and stat.S_ISDIR(self.mode)
 
     @property
     def is_file(self):
+        if self._dir_entry is not None:
+            return self.__dir_entry_is(self._dir_entry.is_file)
+
         return self.exists and stat.S_ISREG(self.mode)
 
     @property
     def is_symlink(self):
+        if self._dir_entry is not None:
+            return self._dir_entry.is_symlink()
+
         return self.exists and stat.S_ISLNK(self.mode)
 
     @property
@@ -63,12 +218,46 @@ class Entry(FieldsMixin):
 
         if self.is_symlink:
             link = os.readlink(self.path)
-            self._readlink = os.path.join(self.path, link)
+            # a relative target is relative to the directory holding the link
+            self._readlink = os.path.join(os.path.dirname(self.path), link)
         else:
             self._readlink = None
 
         return self._readlink
 
+    def follow(self, dir_fd=None, stats=None):
+        '''the file a symbolic link points to, as an entry at the path of the
+        link; the link itself when it is broken or ends in a loop. With
+        `dir_fd`, the directory holding the link, it is found by name; with
+        `stats`, the call is timed as `stat`
+
+        :type dir_fd: int or None
+        :type stats: dirtree.stats.ScanStats or None
+        :rtype: dirtree.entry.Entry
+        '''
+        if stats is not None:
+            start = time.perf_counter()
+
+        try:
+            if dir_fd is None:
+                st = os.stat(self.path)
+            else:
+                st = os.stat(self.name, dir_fd=dir_fd)
+        except OSError:
+            st = None
+
+        if stats is not None:
+            stats.record('stat', start)
+
+        if st is None:
+            return self
+
+        return Entry.restore(self.path, (
+            st.st_mode, st.st_ino, st.st_dev, st.st_nlink, st.st_uid,
+            st.st_gid, st.st_size, st.st_blocks, st.st_atime_ns,
+            st.st_mtime_ns, st.st_ctime_ns,
+        ))
+
     def __len__(self):
         if self.is_dir:
             return self.num_links
@@ -85,41 +274,6 @@ class Entry(FieldsMixin):
         return (self.device, self.inode) == (other.device, other.inode)
 
     @property
-    def mode(self):
-        return self.exists and self.stat.st_mode
-
-    @property
-    def inode(self):
-        return self.exists and self.stat.st_ino
-
-    @property
-    def device(self):
-        return self.exists and self.stat.st_dev
-
-    @property
-    def num_links(self):
-        return self.exists and self.stat.st_nlink
-
-    @property
-    def uid(self):
-        return self.exists and self.stat.st_uid
-
-    @property
-    def gid(self):
-        return self.exists and self.stat.st_gid
-
-    @property
-    def size(self):
-        return self.exists and self.stat.st_size
-
-    @property
-    def atime(self):
-        return self.exists and local_timestamp(self.stat.st_atime)
-
-    @property
-    def mtime(self):
-        return self.exists and local_timestamp(self.stat.st_mtime)
-
-    @property
-    def ctime(self):
-        return self.exists and local_timestamp(self.stat.st_ctime)
+    def disk_usage(self):
+        '''bytes allocated on disk, as reported in 512 byte blocks'''
+        return self.blocks * 512
@@ -0,0 +1,141 @@
+import time
+
+
+def descend_filter(options, root, stats=None):
+    '''a callable telling whether an entry met walking `root` is walked at all,
+    or `None` when every entry is
+
+    The exclude patterns only need the name and path from the directory
+    listing, so they are tried first. Only a directory can cross onto another
+    file system, and the file type comes from the listing too, so the device
+    `options.one_file_system` compares, which needs an `lstat`, is only read
+    for directories that aren't excluded. With `stats`, pattern matching is
+    timed as `exclude` and excluded entries are counted.
+
+    :type options: dirtree.options.Options
+    :type root: dirtree.entry.Entry
+    :type stats: dirtree.stats.ScanStats or None
+    :rtype: callable or None
+    '''
+    matcher = options.exclude_matcher if options.exclude else None
+    if matcher is not None and stats is not None:
+        matcher = _timed_matcher(matcher, stats)
+
+    if not options.one_file_system:
+        if matcher is None:
+            return None
+
+        return lambda entry: not matcher(entry)
+
+    device = root.device
+    if matcher is None:
+        return lambda entry: (
+            entry is root or not entry.is_dir or entry.device == device)
+
+    return lambda entry: not matcher(entry) and (
+        entry is root or not entry.is_dir or entry.device == device)
+
+
+def _timed_matcher(matcher, stats):
+    record = stats.record
+    perf_counter = time.perf_counter
+
+    def timed(entry):
+        start = perf_counter()
+        excluded = matcher(entry)
+        record('exclude', start)
+        stats.excluded += excluded
+        return excluded
+
+    return timed
+
+
+def size_filter(threshold):
+    '''a callable telling whether a size passes `threshold` (at least the
+    threshold, or at most its magnitude when negative), or `None` without one
+
+    :type threshold: int or None
+    :rtype: callable or None
+    '''
+    if threshold is None:
+        return None
+
+    if threshold < 0:
+        limit = -threshold
+        return lambda size: size <= limit
+
+    return lambda size: threshold <= size
+
+
+def shown_filter(options, stats=None):
+    '''a callable `(depth, is_dir, size)` telling whether a total is shown
+    with `options.max_depth`, `options.all` and `options.threshold`
+
+    The depth and the file type are compared before the size, and only the
+    checks the options ask for are made. With `stats`, totals hidden by the
+    threshold are counted in `below_threshold`.
+
+    :type options: dirtree.options.Options
+    :type stats: dirtree.stats.ScanStats or None
+    :rtype: callable
+    '''
+    max_depth = options.max_depth
+    files = options.all
+    size_ok = size_filter(options.threshold)
+
+    if size_ok is not None and stats is not None:
+        passes = size_ok
+
+        def size_ok(size):
+            if passes(size):
+                return True
+
+            stats.below_threshold += 1
+            return False
+
+    if max_depth is None and size_ok is None:
+        if files:
+            return lambda depth, is_dir, size: True
+
+        return lambda depth, is_dir, size: is_dir or not depth
+
+    if max_depth is None:
+        if files:
+            return lambda depth, is_dir, size: size_ok(size)
+
+        return lambda depth, is_dir, size: (
+            (is_dir or not depth) and size_ok(size))
+
+    if size_ok is None:
+        return lambda depth, is_dir, size: depth <= max_depth and (
+            files or is_dir or not depth)
+
+    return lambda depth, is_dir, size: depth <= max_depth and (
+        files or is_dir or not depth) and size_ok(size)
+
+
+def entry_filter(threshold, stats=None):
+    '''a callable telling whether `EntryWalker` yields an entry by its own
+    size, or `None` when it yields every entry; `threshold` is read as by
+    `size_filter`, as for the totals shown
+
+    :type threshold: int or None
+    :type stats: dirtree.stats.ScanStats or None
+    :rtype: callable or None
+    '''
+    if threshold is None:
+        return None
+
+    passes = size_filter(threshold)
+
+    if stats is None:
+        return lambda entry: passes(entry.size)
+
+    def accept(entry):
+        if passes(entry.size):
+            return True
+
+        stats.below_threshold += 1
+        return False
+
+    return accept
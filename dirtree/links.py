@@ -0,0 +1,109 @@
+from array import array
+
+from .mixins import FieldsMixin
+
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class _InodeTable:
+    '''An open-addressing hash set of inode numbers for a single device
+
+    Slots are a flat `array('Q')`, 8 bytes each, kept at most half full; `0`
+    marks an empty slot, so inode `0` is tracked on the side.
+    '''
+
+    def __init__(self, bits=10):
+        self.bits = bits
+        self.count = 0
+        self.has_zero = False
+        self.slots = array('Q', bytes(8 << bits))
+
+    def __slot(self, ino):
+        shift = 64 - self.bits
+        mask = (1 << self.bits) - 1
+        slots = self.slots
+        idx = ((ino * _GOLDEN) & _MASK64) >> shift
+
+        while True:
+            value = slots[idx]
+            if value == 0 or value == ino:
+                return idx
+
+            idx = (idx + 1) & mask
+
+    def __grow(self):
+        old = self.slots
+        self.bits += 1
+        self.slots = array('Q', bytes(8 << self.bits))
+
+        for ino in old:
+            if ino:
+                self.slots[self.__slot(ino)] = ino
+
+    def add(self, ino):
+        if ino == 0:
+            added, self.has_zero = not self.has_zero, True
+            return added
+
+        idx = self.__slot(ino)
+        if self.slots[idx]:
+            return False
+
+        self.slots[idx] = ino
+        self.count += 1
+        if self.count * 2 > len(self.slots):
+            self.__grow()
+
+        return True
+
+    def __contains__(self, ino):
+        if ino == 0:
+            return self.has_zero
+
+        return self.slots[self.__slot(ino)] == ino
+
+    def __len__(self):
+        return self.count + self.has_zero
+
+    @property
+    def nbytes(self):
+        return self.slots.itemsize * len(self.slots)
+
+
+class InodeSet(FieldsMixin):
+    '''The `(st_dev, st_ino)` pairs of hard-linked files already counted
+
+    Only files with more than one link need to be tracked; each device gets its
+    own compact hash table of inode numbers, costing 16 bytes or less per
+    inode instead of a tuple and set entry per link.
+    '''
+
+    __repr_fields__ = ('count', 'nbytes')
+
+    def __init__(self):
+        self.tables = {}
+
+    def add(self, device, inode):
+        '''record the inode; returns `False` if it had been recorded before'''
+        try:
+            table = self.tables[device]
+        except KeyError:
+            table = self.tables[device] = _InodeTable()
+
+        return table.add(inode)
+
+    def __contains__(self, key):
+        device, inode = key
+        table = self.tables.get(device)
+        return table is not None and inode in table
+
+    def __len__(self):
+        return sum(map(len, self.tables.values()))
+
+    count = property(__len__)
+
+    @property
+    def nbytes(self):
+        '''the memory held by the inode tables, in bytes'''
+        return sum(table.nbytes for table in self.tables.values())
@@ -1,9 +1,11 @@
-import pprint
+import sys
 
 from .utils import identity
 
 
 class FieldsMixin:
+    __slots__ = ()
+
     def _iter_repr_fields(self, _repr=repr):
         for field in self.__repr_fields__:
             if isinstance(field, tuple):
@@ -22,21 +24,38 @@ class FieldsMixin:
 
 
 class ValidateMixin:
+    '''Calls `_validate_<name>(value)` for every attribute `name` that has
+    such a method and isn't `None`
+
+    The validated names are found once per class, so only attributes with a
+    validator are ever read.
+    '''
+
+    __slots__ = ()
+
+    @classmethod
+    def _validated_fields(cls):
+        try:
+            return cls.__dict__['_validated_fields_cache']
+        except KeyError:
+            pass
+
+        prefix = '_validate_'
+        fields = tuple(
+            attr[len(prefix):] for attr in dir(cls) if attr.startswith(prefix))
+        setattr(cls, '_validated_fields_cache', fields)
+        return fields
+
     def validate(self):
-        attrs = (attr for attr in dir(self) if not attr.startswith('_'))
-        for attr in attrs:
-            try:
+        for attr in self._validated_fields():
+            value = getattr(self, attr)
+            if value is not None:
                 method = getattr(self, '_validate_%s' % attr)
-            except AttributeError:
-                pass
-            else:
-                value = getattr(self, attr)
-                if value is not None:
-                    try:
-                        method(value)
-                    except TypeError:
-                        # method doesn't accept a parameter
-                        method()
+                try:
+                    method(value)
+                except TypeError:
+                    # method doesn't accept a parameter
+                    method()
 
 
 def _format_kwargs(self, items, stream, indent, allowance, context, level):
@@ -70,4 +89,14 @@ def _pprint_fields_mixin(self, object, stream, indent, allowance, context, level
     stream.write(')')
 
 
-pprint.PrettyPrinter._dispatch[FieldsMixin.__repr__] = _pprint_fields_mixin
+def register_pprint():
+    '''let `pprint` lay out `FieldsMixin` objects field by field, as keyword
+    arguments; done on import when `pprint` is already loaded, since importing
+    it just for this slows down every start'''
+    import pprint
+
+    pprint.PrettyPrinter._dispatch[FieldsMixin.__repr__] = _pprint_fields_mixin
+
+
+if 'pprint' in sys.modules:
+    register_pprint()
@@ -1,17 +1,28 @@
-import datetime
-from operator import methodcaller
+import os
 
 from .entry import Entry
 from .mixins import FieldsMixin, ValidateMixin
 from .reader import Reader
+from .size_type import get_default_block_size
+
+_TIME_FIELDS = {
+    True: 'mtime_ns',
+    'atime': 'atime_ns',
+    'access': 'atime_ns',
+    'use': 'atime_ns',
+    'ctime': 'ctime_ns',
+    'status': 'ctime_ns',
+}
 
 
 class Options(FieldsMixin, ValidateMixin):
     __repr_fields__ = (
-        'all', 'apparent_size', 'block_size', 'count_links', 'dereference',
-        'dereference_args', 'exclude', 'files', 'human_readable', 'inodes',
-        'max_depth', 'null', 'one_file_system', 'separate_dirs', 'si',
-        'threshold', 'time', 'time_style', 'total',
+        'all', 'apparent_size', 'block_size', 'block_suffix', 'breakdown',
+        'cache', 'count_links', 'dereference', 'dereference_args', 'diff',
+        'exclude', 'files', 'format', 'human_readable', 'inodes', 'jobs',
+        'max_depth', 'max_open_dirs', 'null', 'one_file_system', 'processes',
+        'separate_dirs', 'si', 'snapshot', 'stats', 'threshold', 'time',
+        'time_style', 'top', 'top_by', 'total', 'watch',
     )
 
     def __init__(self, args):
@@ -23,11 +34,31 @@ class Options(FieldsMixin, ValidateMixin):
             msg = '`block_size` must be greater than zero, got %d' % value
             raise ValueError(msg)
 
+    def _validate_jobs(self, value):
+        if value <= 0:
+            msg = '`jobs` must be greater than zero, got %d' % value
+            raise ValueError(msg)
+
     def _validate_max_depth(self, value):
         if value < 0:
             msg = '`max_depth` must be greater than or equal to 0, got %d' % value
             raise ValueError(msg)
 
+    def _validate_max_open_dirs(self, value):
+        if value <= 0:
+            msg = '`max_open_dirs` must be greater than zero, got %d' % value
+            raise ValueError(msg)
+
+    def _validate_processes(self, value):
+        if value <= 0:
+            msg = '`processes` must be greater than zero, got %d' % value
+            raise ValueError(msg)
+
+    def _validate_top(self, value):
+        if value <= 0:
+            msg = '`top` must be greater than zero, got %d' % value
+            raise ValueError(msg)
+
     def _validate_human_readable(self):
         if self.human_readable and self.si:
             msg = '`human_readable` and `si` are mutually exclusive'
@@ -60,9 +91,56 @@ class Options(FieldsMixin, ValidateMixin):
     def block_size(self):
         '''if set, the amount to factor output sizes by
 
-        :rtype: int or None
+        :rtype: int
+        '''
+        return self._args.block_size or get_default_block_size()
+
+    @property
+    def block_suffix(self):
+        '''the unit printed after sizes scaled by `block_size`, if any
+
+        :rtype: str
+        '''
+        return self._args.block_suffix
+
+    @property
+    def breakdown(self):
+        '''if set, the per extension, owner, group and age summary collected
+        while aggregating
+
+        :rtype: dirtree.breakdown.Breakdown or None
+        '''
+        try:
+            return self._breakdown
+        except AttributeError:
+            pass
+
+        self._breakdown = None
+        if self._args.breakdown:
+            from .breakdown import Breakdown
+
+            self._breakdown = Breakdown(self._args.breakdown)
+
+        return self._breakdown
+
+    @property
+    def cache(self):
+        '''if set, the scan index reused and refreshed by this scan
+
+        :rtype: dirtree.cache.ScanCache or None
         '''
-        return self._args.block_size
+        try:
+            return self._cache
+        except AttributeError:
+            pass
+
+        self._cache = None
+        if self._args.cache:
+            from .cache import ScanCache
+
+            self._cache = ScanCache(self._args.cache)
+
+        return self._cache
 
     @property
     def count_links(self):
@@ -88,6 +166,15 @@ class Options(FieldsMixin, ValidateMixin):
         '''
         return self.dereference or self._args.dereference_args
 
+    @property
+    def diff(self):
+        '''if set, the paths of an older and a newer snapshot to compare
+        instead of scanning
+
+        :rtype: (str, str) or None
+        '''
+        return self._args.diff
+
     @property
     def exclude(self):
         '''exclude file patterns
@@ -99,9 +186,11 @@ class Options(FieldsMixin, ValidateMixin):
         except AttributeError:
             pass
 
-        from .pattern import exclude, exclude_from
-
         self._exclude = []
+        if not (self._args.exclude or self._args.exclude_from):
+            return self._exclude
+
+        from .pattern import exclude, exclude_from
 
         if self._args.exclude:
             self._exclude.extend(map(exclude, self._args.exclude))
@@ -111,6 +200,22 @@ class Options(FieldsMixin, ValidateMixin):
 
         return self._exclude
 
+    @property
+    def exclude_matcher(self):
+        '''all exclude patterns compiled into a single matcher
+
+        :rtype: dirtree.pattern.PatternMatcher
+        '''
+        try:
+            return self._exclude_matcher
+        except AttributeError:
+            pass
+
+        from .pattern import PatternMatcher
+
+        self._exclude_matcher = PatternMatcher(self.exclude)
+        return self._exclude_matcher
+
     @property
     def files(self):
         '''the top level files to recursively iterate over
@@ -122,18 +227,35 @@ class Options(FieldsMixin, ValidateMixin):
         except AttributeError:
             pass
 
-        self._files = []
+        self._files = list(self.iter_files())
+        return self._files
+
+    def iter_files(self):
+        '''the top level files, produced as `files0_from` is read, without
+        collecting them first
+
+        :rtype: iter([dirtree.walker.Entry])
+        '''
+        if hasattr(self, '_files'):
+            yield from self._files
+            return
+
+        empty = True
         for file in self._iter_files(self._args.files0_from, *self._args.files):
-            entry = Entry(file)
-            self._files.append(entry)
-            if self.dereference_args and entry.is_symlink:
-                entry = Entry(entry.readlink)
-                self._files.append(entry)
+            empty = False
+            # with `dereference_args`, the walker follows a link itself
+            yield Entry(file)
 
-        if not self._files:
-            self._files.append(Entry('.'))
+        if empty:
+            yield Entry('.')
 
-        return self._files
+    @property
+    def format(self):
+        '''the output format, one of `dirtree.output.FORMATS`
+
+        :rtype: str
+        '''
+        return self._args.format
 
     @property
     def human_readable(self):
@@ -151,6 +273,14 @@ class Options(FieldsMixin, ValidateMixin):
         '''
         return self._args.inodes
 
+    @property
+    def jobs(self):
+        '''if greater than one, the number of threads used to list directories
+
+        :rtype: int or None
+        '''
+        return self._args.jobs
+
     @property
     def max_depth(self):
         '''if specified, print the directory only if it is within `N` or fewer
@@ -160,6 +290,14 @@ class Options(FieldsMixin, ValidateMixin):
         '''
         return self._args.max_depth
 
+    @property
+    def max_open_dirs(self):
+        '''if specified, the most directory handles held open during a walk
+
+        :rtype: int or None
+        '''
+        return self._args.max_open_dirs
+
     @property
     def null(self):
         '''terminate output records with a `NUL` byte instead of a newline
@@ -176,6 +314,15 @@ class Options(FieldsMixin, ValidateMixin):
         '''
         return self._args.one_file_system
 
+    @property
+    def processes(self):
+        '''if greater than one, the number of worker processes the
+        subdirectories of each root are walked in
+
+        :rtype: int or None
+        '''
+        return self._args.processes
+
     @property
     def separate_dirs(self):
         '''for directories, do not include the size of subdirectories
@@ -192,6 +339,59 @@ class Options(FieldsMixin, ValidateMixin):
         '''
         return self._args.si
 
+    @property
+    def size_unit(self):
+        '''what sizes count: `inodes`, `apparent_size` or `disk_usage`, all
+        but the first in bytes
+
+        :rtype: str
+        '''
+        if self.inodes:
+            return 'inodes'
+
+        if self.apparent_size:
+            return 'apparent_size'
+
+        return 'disk_usage'
+
+    @property
+    def snapshot(self):
+        '''if set, where the directories of this scan are saved for `diff`
+
+        :rtype: dirtree.snapshot.SnapshotWriter or None
+        '''
+        try:
+            return self._snapshot
+        except AttributeError:
+            pass
+
+        self._snapshot = None
+        if self._args.snapshot:
+            from .snapshot import SnapshotWriter
+
+            self._snapshot = SnapshotWriter(self._args.snapshot, self.size_unit)
+
+        return self._snapshot
+
+    @property
+    def stats(self):
+        '''if set, the counters and timings collected during the scan
+
+        :rtype: dirtree.stats.ScanStats or None
+        '''
+        try:
+            return self._stats
+        except AttributeError:
+            pass
+
+        self._stats = None
+        if self._args.stats:
+            from .stats import ScanStats
+
+            self._stats = ScanStats()
+
+        return self._stats
+
     @property
     def threshold(self):
         '''include entries smaller than threshold if positive, or greater if neg
@@ -209,6 +409,18 @@ class Options(FieldsMixin, ValidateMixin):
         '''
         return self._args.time
 
+    @property
+    def time_field(self):
+        '''the `Entry` attribute holding the nanoseconds shown by `time`, or
+        ranked by `top_by`; `None` when times aren't needed
+
+        :rtype: str or None
+        '''
+        if not self.time and self.top and self.top_by == 'time':
+            return _TIME_FIELDS[True]
+
+        return _TIME_FIELDS.get(self.time)
+
     @property
     def time_style(self):
         '''output time format
@@ -217,6 +429,22 @@ class Options(FieldsMixin, ValidateMixin):
         '''
         return self._args.time_style
 
+    @property
+    def top(self):
+        '''if set, only list the `N` largest entries by `top_by`
+
+        :rtype: int or None
+        '''
+        return self._args.top
+
+    @property
+    def top_by(self):
+        '''what `top` ranks by, one of `dirtree.top.TOP_KEYS`
+
+        :rtype: str
+        '''
+        return self._args.top_by
+
     @property
     def total(self):
         '''yield a total row record of the input files
@@ -225,8 +453,18 @@ class Options(FieldsMixin, ValidateMixin):
         '''
         return self._args.total
 
+    @property
+    def watch(self):
+        '''keep the totals current from file system events after the first scan
+
+        :rtype: bool
+        '''
+        return self._args.watch
+
     def strftime(self, mmt=None):
         if mmt is None:
+            import datetime
+
             mmt = datetime.datetime.now()
 
         return mmt.strftime(self.time_style)
@@ -243,4 +481,6 @@ class Options(FieldsMixin, ValidateMixin):
 
         with files0_from:
             reader = Reader(files0_from, b'\x00')
-            yield from map(methodcaller('decode', 'utf-8'), reader)
+            # as the names the walker lists, bytes that aren't valid in the
+            # file system encoding round trip
+            yield from map(os.fsdecode, reader)
@@ -0,0 +1,336 @@
+import io
+import math
+import sys
+import time
+
+from .constants import PREFIXES
+from .utils import ns_formatter
+
+FORMATS = ('du', 'jsonl', 'csv', 'packed')
+
+_SUFFIXES = tuple(PREFIXES)[1:]
+
+
+def human_size(value, base=1024):
+    '''format `value` the way `du -h` does: rounded up, with one decimal below
+    ten and a unit suffix from K upwards (k for powers of 1000)'''
+    if value < base:
+        return '%d' % value
+
+    for suffix in _SUFFIXES:
+        if base == 1000 and suffix == 'K':
+            suffix = 'k'
+
+        value /= base
+        if value < 10 and math.ceil(value * 10) < 100:
+            return '%.1f%s' % (math.ceil(value * 10) / 10, suffix)
+
+        if math.ceil(value) < base or suffix == 'Y':
+            return '%d%s' % (math.ceil(value), suffix)
+
+
+def size_formatter(options):
+    '''a callable turning a size in bytes (or inodes) into its display text,
+    chosen once for the combination of `options`'''
+    if options.human_readable:
+        return human_size
+
+    if options.si:
+        return lambda value: human_size(value, 1000)
+
+    if options.inodes or options.block_size == 1:
+        return str
+
+    block_size = options.block_size
+    suffix = options.block_suffix
+    return lambda value: '%d%s' % (-(-value // block_size), suffix)
+
+
+def time_formatter(options):
+    '''a callable returning the `--time` text of a `Total`, or `None`'''
+    if not options.time:
+        return None
+
+    field = options.time_field
+
+    fmt_ns = ns_formatter(options.time_style)
+
+    def fmt(total):
+        time_ns = total.time_ns
+        if time_ns is None:
+            if total.entry is None:
+                return ''
+
+            time_ns = getattr(total.entry, field)
+
+        return fmt_ns(time_ns)
+
+    return fmt
+
+
+def du_formatter(options):
+    size = size_formatter(options)
+    time = time_formatter(options)
+    end = '\0' if options.null else '\n'
+
+    if time is None:
+        return lambda total: '%s\t%s%s' % (size(total.size), total.path, end)
+
+    return lambda total: '%s\t%s\t%s%s' % (
+        size(total.size), time(total), total.path, end)
+
+
+def json_encoder():
+    '''a compact `json` encoding callable; `json` is only imported when a
+    JSON format is used'''
+    import json
+
+    return json.JSONEncoder(separators=(',', ':')).encode
+
+
+def csv_row_formatter(end):
+    '''a callable formatting a row as one CSV record ending with `end`'''
+    import csv
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator=end)
+
+    def fmt(row):
+        writer.writerow(row)
+        line = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return line
+
+    return fmt
+
+
+def jsonl_formatter(options):
+    key = 'inodes' if options.inodes else 'size'
+    time = time_formatter(options)
+    end = '\0' if options.null else '\n'
+    dumps = json_encoder()
+
+    if time is None:
+        return lambda total: dumps({
+            'path': total.path, key: total.size, 'depth': total.depth,
+        }) + end
+
+    return lambda total: dumps({
+        'path': total.path, key: total.size, 'depth': total.depth,
+        'time': time(total),
+    }) + end
+
+
+def csv_formatter(options):
+    time = time_formatter(options)
+    fmt_row = csv_row_formatter('\0' if options.null else '\n')
+
+    def fmt(total):
+        row = [total.size, total.path, total.depth]
+        if time is not None:
+            row.append(time(total))
+
+        return fmt_row(row)
+
+    return fmt
+
+
+def breakdown_formatter(options):
+    '''a callable formatting a `(group, key, size, files)` row of
+    `dirtree.breakdown.Breakdown.rows`'''
+    end = '\0' if options.null else '\n'
+    key = 'inodes' if options.inodes else 'size'
+
+    if options.format == 'jsonl':
+        dumps = json_encoder()
+        return lambda row: dumps({
+            'group': row[0], 'key': row[1], key: row[2], 'files': row[3],
+        }) + end
+
+    if options.format == 'csv':
+        return csv_row_formatter(end)
+
+    size = size_formatter(options)
+    return lambda row: '%s\t%d\t%s:%s%s' % (
+        size(row[2]), row[3], row[0], row[1], end)
+
+
+def change_formatter(options, unit):
+    '''a callable formatting a `dirtree.snapshot.Change` between snapshots
+    whose sizes are in `unit`, with signed deltas'''
+    end = '\0' if options.null else '\n'
+
+    if options.format == 'jsonl':
+        dumps = json_encoder()
+        return lambda change: dumps({
+            'path': change.path, 'status': change.status, 'size': change.size,
+            'inodes': change.count,
+        }) + end
+
+    if options.format == 'csv':
+        fmt_row = csv_row_formatter(end)
+        return lambda change: fmt_row(
+            (change.size, change.count, change.status, change.path))
+
+    size = str if unit == 'inodes' else size_formatter(options)
+
+    def signed(value):
+        return ('-' if value < 0 else '+') + size(abs(value))
+
+    # the entry count is a plain number, whatever the size unit
+    return lambda change: '%s\t%+d\t%s\t%s%s' % (
+        signed(change.size), change.count, change.status, change.path, end)
+
+
+def csv_header(options):
+    header = ['inodes' if options.inodes else 'size', 'path', 'depth']
+    if options.time:
+        header.append('time')
+
+    return header
+
+
+def packed_row(total):
+    '''the path and `dirtree.packed.COLUMNS` values of a `Total`; the grand
+    total has only a size'''
+    entry = total.entry
+    if entry is None:
+        return total.path, total.size, 0, 0, 0, 0, 0, 0, 0, total.depth
+
+    return (
+        entry.path, total.size, entry.blocks, entry.inode, entry.device,
+        entry.num_links, entry.uid, entry.gid, entry.mtime_ns, total.depth,
+    )
+
+
+_FORMATTERS = {
+    'du': du_formatter,
+    'jsonl': jsonl_formatter,
+    'csv': csv_formatter,
+}
+
+
+class OutputWriter:
+    '''Writes `Total` records to a binary `stream` in one of `FORMATS`
+
+    The formatter is selected once for the options in effect, records are
+    terminated with `NUL` for `options.null`, and the encoded lines are
+    collected and written in batches of about `batch_size` bytes. With
+    `options.stats`, formatting and writing are timed as `output`. CSV output
+    starts with the header of `Total` records unless `header` is false.
+
+    The `packed` format is written by a `dirtree.packed.PackedWriter`, which
+    is only complete once the writer is closed, and holds nothing but totals.
+
+    :type options: dirtree.options.Options
+    :type stream: io.BufferedIOBase or None
+    :type fmt: str or None
+    :type batch_size: int
+    :type header: bool
+    '''
+
+    def __init__(self, options, stream=None, fmt=None, batch_size=64 * 1024,
+                 header=True):
+        self.options = options
+        self.stream = sys.stdout.buffer if stream is None else stream
+        self.fmt = fmt or options.format or 'du'
+        self.batch_size = batch_size
+
+        self.__stats = options.stats
+        self.__batch = []
+        self.__pending = 0
+        self.__packed = None
+
+        if self.fmt == 'packed':
+            from .packed import PackedWriter
+
+            self.__packed = PackedWriter(self.stream, options.size_unit)
+            self.__format = None
+        else:
+            self.__format = _FORMATTERS[self.fmt](options)
+
+        if self.fmt == 'csv' and header:
+            end = '\0' if options.null else '\n'
+            self.__write(','.join(csv_header(options)) + end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __write(self, line):
+        data = line.encode('utf-8', 'surrogateescape')
+        self.__batch.append(data)
+        self.__pending += len(data)
+        if self.__pending >= self.batch_size:
+            self.flush()
+
+    def write(self, total):
+        '''format and queue one record
+
+        :type total: dirtree.aggregate.Total
+        '''
+        stats = self.__stats
+        start = time.perf_counter() if stats is not None else 0
+
+        if self.__packed is not None:
+            self.__packed.add(*packed_row(total))
+        else:
+            self.__write(self.__format(total))
+
+        if stats is not None:
+            stats.record('output', start)
+
+    def write_breakdown(self, breakdown):
+        '''write the rows of `breakdown` after the totals; CSV output starts a
+        second table with its own header
+
+        :type breakdown: dirtree.breakdown.Breakdown
+        '''
+        fmt = breakdown_formatter(self.options)
+        if self.fmt == 'csv':
+            end = '\0' if self.options.null else '\n'
+            key = 'inodes' if self.options.inodes else 'size'
+            self.__write(','.join(('group', 'key', key, 'files')) + end)
+
+        for row in breakdown.rows():
+            self.__write(fmt(row))
+
+    def write_changes(self, changes, unit):
+        '''write the differences between two snapshots, see
+        `dirtree.snapshot.diff`; CSV output has a header of its own
+
+        :type changes: iter([dirtree.snapshot.Change])
+        :type unit: str
+        '''
+        fmt = change_formatter(self.options, unit)
+        if self.fmt == 'csv':
+            end = '\0' if self.options.null else '\n'
+            self.__write(','.join(('size', 'inodes', 'status', 'path')) + end)
+
+        for change in changes:
+            self.__write(fmt(change))
+
+    def write_all(self, totals):
+        for total in totals:
+            self.write(total)
+
+        self.flush()
+
+    def close(self):
+        '''flush the queued records, and finish the `packed` format'''
+        self.flush()
+        if self.__packed is not None:
+            self.__packed.close()
+
+    def flush(self):
+        if self.__batch:
+            # taken off first, so a failed write isn't tried again on close
+            data = b''.join(self.__batch)
+            self.__batch = []
+            self.__pending = 0
+            self.stream.write(data)
+
+        self.stream.flush()
@@ -0,0 +1,348 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+MAGIC = b'DTPACK\0\0'
+TRAILER_MAGIC = b'DTPKEND\0'
+VERSION = 1
+
+#: the integer columns of every record, with their `array` type codes
+COLUMNS = (
+    ('size', 'q'),
+    ('blocks', 'q'),
+    ('inode', 'Q'),
+    ('device', 'Q'),
+    ('nlink', 'I'),
+    ('uid', 'I'),
+    ('gid', 'I'),
+    ('mtime_ns', 'q'),
+    ('depth', 'I'),
+)
+
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+
+#: records per block; each block has its own columns and path data
+DEFAULT_BLOCK_SIZE = 4096
+
+#: paths are stored whole every `RESTART` records, front coded in between
+RESTART = 16
+
+_HEADER = struct.Struct('<8sHHI')
+_TRAILER = struct.Struct('<QQ8s')
+_OFFSET = struct.Struct('<Q')
+_RESTART = struct.Struct('<I')
+
+_WIDTHS = tuple(struct.calcsize('<' + code) for _, code in COLUMNS)
+_ROW_WIDTH = sum(_WIDTHS)
+_SWAP = sys.byteorder != 'little'
+
+PackedRecord = namedtuple('PackedRecord', ('path', ) + COLUMN_NAMES)
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return out
+
+
+def _common_prefix(a, b):
+    # a binary search over slice comparisons, which run in C
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class PackedWriter:
+    '''Writes records of a path and the integer `COLUMNS` to `stream` in a
+    compact binary format that `PackedReader` maps and reads in place
+
+    Records are grouped into blocks of `block_size`. In a block, each column
+    is a little-endian array of fixed width integers, followed by the offsets
+    of every `RESTART`th path and the paths themselves, front coded: each
+    stores only the length it shares with the one before it and the rest.
+    An index of block offsets and a trailer with its position and the record
+    count are written by `close`. Blocks are written as they fill, so
+    `stream` doesn't need to be seekable and memory is bound by `block_size`.
+
+    :type stream: io.BufferedIOBase
+    :type unit: str
+    :type block_size: int
+    '''
+
+    def __init__(self, stream, unit='disk_usage', block_size=DEFAULT_BLOCK_SIZE):
+        self.stream = stream
+        self.unit = unit
+        self.block_size = block_size
+        self.count = 0
+
+        self.__offsets = array('Q')
+        self.__columns = [array(code) for _, code in COLUMNS]
+        self.__restarts = array('I')
+        self.__paths = bytearray()
+        self.__last = b''
+        self.__closed = False
+
+        unit = unit.encode('ascii')
+        self.__offset = self.__write(
+            _HEADER.pack(MAGIC, VERSION, len(unit), block_size) + unit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __write(self, data):
+        self.stream.write(data)
+        return len(data)
+
+    def add(self, path, *values):
+        '''add a record of `path` and one value for each of `COLUMNS`
+
+        :type path: str
+        :type values: (int)
+        '''
+        rows = len(self.__columns[0])
+        for column, value in zip(self.__columns, values):
+            column.append(value)
+
+        encoded = os.fsencode(path)
+        if rows % RESTART:
+            shared = _common_prefix(self.__last, encoded)
+        else:
+            self.__restarts.append(len(self.__paths))
+            shared = 0
+
+        paths = self.__paths
+        paths += _varint(shared)
+        paths += _varint(len(encoded) - shared)
+        paths += encoded[shared:]
+        self.__last = encoded
+
+        self.count += 1
+        if rows + 1 >= self.block_size:
+            self.__flush_block()
+
+    def __flush_block(self):
+        if not self.__columns[0]:
+            return
+
+        self.__offsets.append(self.__offset)
+        for column in self.__columns:
+            if _SWAP:
+                column.byteswap()
+            self.__offset += self.__write(column.tobytes())
+
+        restarts = self.__restarts
+        if _SWAP:
+            restarts.byteswap()
+        self.__offset += self.__write(restarts.tobytes())
+        self.__offset += self.__write(bytes(self.__paths))
+
+        self.__columns = [array(code) for _, code in COLUMNS]
+        self.__restarts = array('I')
+        self.__paths = bytearray()
+        self.__last = b''
+
+    def close(self):
+        '''write the last block, the index and the trailer'''
+        if self.__closed:
+            return
+
+        self.__closed = True
+        self.__flush_block()
+
+        index = self.__offset
+        offsets = self.__offsets
+        if _SWAP:
+            offsets.byteswap()
+        self.__write(offsets.tobytes())
+        self.__write(_TRAILER.pack(index, self.count, TRAILER_MAGIC))
+        self.stream.flush()
+
+
+class PackedReader:
+    '''Reads a file written by `PackedWriter` through `mmap`, without parsing
+    it first
+
+    Opening reads only the header and the trailer. A record is found by its
+    block, and a value by its fixed offset in the block's column; a path is
+    decoded from the closest preceding whole path, at most `RESTART - 1`
+    records back. Iterating decodes the records in order.
+
+    :type path: str
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            try:
+                self.__map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError('%s is not a dirtree packed file' % path)
+
+        view = self.__map
+        if len(view) < _HEADER.size + _TRAILER.size:
+            self.close()
+            raise ValueError('%s is not a dirtree packed file' % path)
+
+        magic, version, unit_len, self.block_size = _HEADER.unpack_from(view)
+        index, self.count, end = _TRAILER.unpack_from(
+            view, len(view) - _TRAILER.size)
+        if magic != MAGIC or end != TRAILER_MAGIC:
+            self.close()
+            raise ValueError('%s is not a dirtree packed file' % path)
+
+        if version > VERSION:
+            self.close()
+            raise ValueError('%s is a newer packed file version' % path)
+
+        start = _HEADER.size
+        self.unit = view[start:start + unit_len].decode('ascii')
+        self.__index = index
+        self.__blocks = -(-self.count // self.block_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.__map.close()
+
+    def __len__(self):
+        return self.count
+
+    def __block(self, idx):
+        '''the offset, number of records and path data offset of block `idx`'''
+        offset = _OFFSET.unpack_from(self.__map, self.__index + idx * 8)[0]
+        rows = min(self.block_size, self.count - idx * self.block_size)
+        paths = offset + rows * _ROW_WIDTH + -(-rows // RESTART) * 4
+        return offset, rows, paths
+
+    def __locate(self, idx):
+        if idx < 0:
+            idx += self.count
+        if not 0 <= idx < self.count:
+            raise IndexError('record index out of range')
+
+        return divmod(idx, self.block_size)
+
+    def value_at(self, name, idx):
+        '''the value of column `name` of record `idx`
+
+        :type name: str
+        :type idx: int
+        :rtype: int
+        '''
+        block, row = self.__locate(idx)
+        offset, rows, _ = self.__block(block)
+        column = COLUMN_NAMES.index(name)
+        offset += sum(_WIDTHS[:column]) * rows + _WIDTHS[column] * row
+        return struct.unpack_from('<' + COLUMNS[column][1], self.__map, offset)[0]
+
+    def path_at(self, idx):
+        '''the path of record `idx`
+
+        :type idx: int
+        :rtype: str
+        '''
+        block, row = self.__locate(idx)
+        offset, rows, paths = self.__block(block)
+
+        first = row - row % RESTART
+        restart = offset + rows * _ROW_WIDTH + first // RESTART * 4
+        pos = paths + _RESTART.unpack_from(self.__map, restart)[0]
+
+        path = b''
+        for _ in range(first, row + 1):
+            path, pos = self.__next_path(path, pos)
+
+        return os.fsdecode(path)
+
+    def __varint(self, pos):
+        view = self.__map
+        value = shift = 0
+        while True:
+            byte = view[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, pos
+            shift += 7
+
+    def __next_path(self, last, pos):
+        shared, pos = self.__varint(pos)
+        length, pos = self.__varint(pos)
+        return last[:shared] + self.__map[pos:pos + length], pos + length
+
+    def __getitem__(self, idx):
+        '''the record `idx`
+
+        :type idx: int
+        :rtype: dirtree.packed.PackedRecord
+        '''
+        block, row = self.__locate(idx)
+        offset, rows, _ = self.__block(block)
+
+        values = []
+        for (_, code), width in zip(COLUMNS, _WIDTHS):
+            values.append(struct.unpack_from(
+                '<' + code, self.__map, offset + width * row)[0])
+            offset += width * rows
+
+        return PackedRecord(self.path_at(idx), *values)
+
+    def column(self, name):
+        '''yield every value of column `name`, a block at a time
+
+        :type name: str
+        :rtype: iter(int)
+        '''
+        column = COLUMN_NAMES.index(name)
+        code = COLUMNS[column][1]
+        skip = sum(_WIDTHS[:column])
+        for block in range(self.__blocks):
+            offset, rows, _ = self.__block(block)
+            start = offset + skip * rows
+            data = memoryview(self.__map)[start:start + _WIDTHS[column] * rows]
+            with data:
+                if _SWAP:
+                    values = array(code, data)
+                    values.byteswap()
+                    yield from values
+                else:
+                    with data.cast(code) as values:
+                        yield from values
+
+    def __iter__(self):
+        view = self.__map
+        for block in range(self.__blocks):
+            offset, rows, pos = self.__block(block)
+            columns = []
+            for (_, code), width in zip(COLUMNS, _WIDTHS):
+                values = array(code, view[offset:offset + width * rows])
+                if _SWAP:
+                    values.byteswap()
+                columns.append(values)
+                offset += width * rows
+
+            path = b''
+            for row in range(rows):
+                if not row % RESTART:
+                    path = b''
+                path, pos = self.__next_path(path, pos)
+                yield PackedRecord(
+                    os.fsdecode(path), *(column[row] for column in columns))
@@ -1,9 +1,11 @@
-import collections
+import collections.abc
 import fnmatch
 import re
 
 from .mixins import FieldsMixin
 
+_MAGIC = re.compile(r'[*?[]')
+
 
 def exclude(pattern):
     return FilePredicate(pattern, fnmatch.translate(pattern))
@@ -18,17 +20,114 @@ def exclude_from(file):
         return [exclude(line) for line in it if line and not line.startswith('#')]
 
 
-class FilePredicate(collections.Callable, FieldsMixin):
+class FilePredicate(collections.abc.Callable, FieldsMixin):
+    '''Matches a single shell pattern against an entry; patterns containing a
+    `/` are matched against the end of the path, others against the whole name
+    '''
+
     __repr_fields__ = ('fn_pattern', 're_pattern')
 
     def __init__(self, fn_pattern, re_pattern):
         self.fn_pattern = fn_pattern
         self.re_pattern = re_pattern
+        self.is_path = '/' in fn_pattern
 
         self._re = re.compile(re_pattern, re.I)
 
     def __call__(self, entry):
-        if '/' in self.fn_pattern:
+        if self.is_path:
             return bool(self._re.search(entry.path))
 
-        return bool(self._re.search(entry.name))
+        return bool(self._re.match(entry.name))
+
+
+class _SuffixSet:
+    '''set membership for the ends of strings, bucketed by suffix length so a
+    lookup costs one slice and hash per distinct length'''
+
+    def __init__(self):
+        self.by_length = {}
+
+    def add(self, suffix):
+        self.by_length.setdefault(len(suffix), set()).add(suffix)
+
+    def __bool__(self):
+        return bool(self.by_length)
+
+    def __contains__(self, value):
+        for length, suffixes in self.by_length.items():
+            if value[-length:] in suffixes:
+                return True
+
+        return False
+
+
+class PatternMatcher(collections.abc.Callable, FieldsMixin):
+    '''Matches many shell patterns against an entry at once
+
+    Patterns are split into name patterns and path patterns (those containing a
+    `/`). Literal names and simple suffixes (e.g., `*.o`) are answered with set
+    lookups, and every remaining pattern of a group is folded into one compiled
+    alternation, so the cost per entry stays roughly flat as patterns are added.
+
+    :type predicates: [dirtree.pattern.FilePredicate]
+    '''
+
+    __repr_fields__ = ('patterns', )
+
+    def __init__(self, predicates=()):
+        self.patterns = []
+
+        self._names = set()
+        self._name_suffixes = _SuffixSet()
+        self._path_suffixes = _SuffixSet()
+        name_res, path_res = [], []
+
+        for pred in predicates:
+            pattern = pred.fn_pattern
+            self.patterns.append(pattern)
+            folded = pattern.lower()
+
+            if pred.is_path:
+                if _MAGIC.search(folded):
+                    path_res.append(pred.re_pattern)
+                else:
+                    self._path_suffixes.add(folded)
+            elif not _MAGIC.search(folded):
+                self._names.add(folded)
+            elif folded[:1] == '*' and not _MAGIC.search(folded, 1) and folded[1:]:
+                self._name_suffixes.add(folded[1:])
+            else:
+                name_res.append(pred.re_pattern)
+
+        self._name_re = self._compile(name_res)
+        self._path_re = self._compile(path_res)
+
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return None
+
+        return re.compile('|'.join('(?:%s)' % p for p in patterns), re.I)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __call__(self, entry):
+        name = entry.name.lower()
+        if name in self._names or name in self._name_suffixes:
+            return True
+
+        if self._name_re is not None and self._name_re.match(entry.name):
+            return True
+
+        if self._path_suffixes and entry.path.lower() in self._path_suffixes:
+            return True
+
+        if self._path_re is not None and self._path_re.search(entry.path):
+            return True
+
+        return False
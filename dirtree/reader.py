@@ -1,67 +1,159 @@
+import mmap
+import os
+import stat
+
+from .constants import DEFAULT_BUF_SIZE
+
+SEPARATORS = (b'\x00', b'\r\n', b'\r', b'\n')
+
+
 class Reader:
-    def __init__(self, stream, sep=None, buf_size=1024 * 4):
+    '''Splits `stream` into records separated by `sep`, skipping empty ones
+
+    When `sep` is not given, the first of `NUL`, `CRLF`, `CR` or `LF` found in
+    the input is used. Binary regular files are memory mapped and split a
+    window at a time; anything else is read `buf_size` at a time into a
+    `bytearray`. Either way, all complete records of a window are split off in
+    one call and only the unfinished tail is carried over, so each byte is
+    copied a bounded number of times no matter how short the records are.
+
+    :type stream: io.IOBase
+    :type sep: bytes or str or None
+    :type buf_size: int
+    '''
+
+    def __init__(self, stream, sep=None, buf_size=DEFAULT_BUF_SIZE):
         self.stream = stream
         self.sep = sep
         self.buf_size = buf_size
 
-        self.__buffer = None
-        self.__eof = False
+        self.__records = None
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if not self.__buffer:
-            self.__read_block()
-
-        if not self.__buffer and self.__eof:
-            raise StopIteration
-
-        if not self.sep:
-            for blk in (b'\x00', b'\r\n', b'\r', b'\n', '\r\n', '\r', '\n'):
-                try:
-                    idx = self.__buffer.index(blk)
-                except (ValueError, TypeError):
-                    pass
-                else:
-                    self.sep = blk
-                    break
-            else:
-                return self.__advance()
+        if self.__records is None:
+            self.__records = self.__split_mapped() or self.__split_buffered()
+
+        return next(self.__records)
+
+    def __detect(self, buffer, eof):
+        if self.sep:
+            return True
+
+        if not eof and buffer[-1:] in (b'\r', '\r'):
+            # could be the first half of a CRLF
+            return False
+
+        for sep in SEPARATORS:
+            if isinstance(buffer, str):
+                sep = sep.decode('ascii')
+
+            if sep in buffer:
+                self.sep = sep
+                return True
+
+        return eof
+
+    def __map(self):
+        try:
+            fd = self.stream.fileno()
+            if not stat.S_ISREG(os.fstat(fd).st_mode):
+                return None
+
+            offset = self.stream.tell()
+            if isinstance(self.stream.read(0), str):
+                return None
+
+            return mmap.mmap(fd, 0, access=mmap.ACCESS_READ), offset
+        except (AttributeError, OSError, ValueError):
+            # not a file, not seekable, or empty
+            return None
+
+    def __split_mapped(self):
+        mapped = self.__map()
+        if mapped is None:
+            return None
+
+        return self.__iter_mapped(*mapped)
+
+    def __iter_mapped(self, view, pos):
+        with view:
+            end = len(view)
+            if not self.sep:
+                self.sep = next(
+                    (sep for sep in SEPARATORS if view.find(sep, pos) >= 0), None)
+
+            sep = self.sep
+            if not sep:
+                if pos < end:
+                    yield view[pos:end]
+                return
+
+            while pos < end:
+                # split a window ending on its last separator in one call
+                stop = min(pos + self.buf_size, end)
+                idx = view.rfind(sep, pos, stop)
+                if idx < 0:
+                    idx = view.find(sep, stop)
+                if idx < 0:
+                    idx = end
+
+                yield from filter(None, view[pos:idx].split(sep))
+                pos = idx + len(sep)
+
+            self.stream.seek(end)
+
+    def __fill(self):
+        while True:
+            block = self.stream.read(self.buf_size)
+            if block is not None:
+                return block
 
-        if self.sep not in self.__buffer:
-            return self.__advance()
-
-        idx = self.__buffer.index(self.sep)
-        value, self.__buffer = self.__buffer[:idx], self.__buffer[idx + 1:]
-
-        if not value:
-            return self.__advance()
-
-        return value
-
-    def __advance(self):
-        if self.__eof:
-            buf, self.__buffer = self.__buffer, None
-            return buf
-
-        self.__read_block()
-        return next(self)
+            # stream isn't ready, try again
 
-    def __read_block(self):
-        if self.__eof:
-            return
+    def __split_buffered(self):
+        block = self.__fill()
+        text = isinstance(block, str)
+        buffer = block if text else bytearray(block)
+        eof = not block
+
+        while not self.__detect(buffer, eof):
+            block = self.__fill()
+            eof = not block
+            buffer += block
+
+        sep = self.sep
+        pos = 0
+
+        while sep:
+            # every complete record in the buffer is split off in one call
+            idx = buffer.rfind(sep, pos)
+            if idx >= pos:
+                if text:
+                    chunk = buffer[pos:idx]
+                else:
+                    with memoryview(buffer) as view:
+                        chunk = bytes(view[pos:idx])
 
-        block = self.stream.read(self.buf_size)
+                yield from filter(None, chunk.split(sep))
+                pos = idx + len(sep)
 
-        if block is None:
-            # stream isn't ready, try again
-            return
+            if eof:
+                break
 
-        if self.__buffer is None:
-            self.__buffer = type(block)()
+            # keep only the unfinished record, then append the next block
+            if text:
+                buffer = buffer[pos:]
+            else:
+                del buffer[:pos]
 
-        self.__buffer = self.__buffer + block
+            pos = 0
+            block = self.__fill()
+            eof = not block
+            buffer += block
 
-        if not block:
-            self.__eof = True
+        if pos < len(buffer):
+            tail = buffer[pos:]
+            yield tail if text else bytes(tail)
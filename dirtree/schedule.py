@@ -0,0 +1,187 @@
+import os
+from collections import deque
+from itertools import islice
+
+from .constants import DEFAULT_ROOT_WINDOW
+
+
+class Root:
+    '''A top level file, and the other roots it overlaps with
+
+    `captures` maps the paths at which later roots will be reached while this
+    one is walked; `grafts` maps the paths of earlier, already walked roots
+    nested inside this one. `total` and `shown`, the newest times `time_ns`
+    and `shown_time_ns`, and, when saving a snapshot, the number of entries
+    `count` are set once it is walked; `yielded` once its `Total` has been
+    produced, by its own walk or by the walk that captured it.
+
+    :type entry: dirtree.entry.Entry
+    :type norm: str
+    '''
+
+    __slots__ = (
+        'entry', 'norm', 'captures', 'grafts', 'covered', 'total', 'shown',
+        'time_ns', 'shown_time_ns', 'count', 'yielded',
+    )
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.norm = os.path.normpath(os.path.abspath(entry.path))
+        self.captures = {}
+        self.grafts = {}
+        self.covered = False
+        self.total = None
+        self.shown = None
+        self.time_ns = None
+        self.shown_time_ns = None
+        self.count = 0
+        self.yielded = False
+
+    def path_of(self, other):
+        '''the path `other` is reached at when walking this root'''
+        if other.norm == self.norm:
+            return self.entry.path
+
+        relpath = os.path.relpath(other.norm, self.norm)
+        return os.path.join(self.entry.path, relpath)
+
+
+def _ancestors(norm):
+    '''`norm` and every directory above it'''
+    while True:
+        yield norm
+        parent = os.path.dirname(norm)
+        if parent == norm:
+            return
+        norm = parent
+
+
+def _outermost(grafts):
+    '''the `grafts` that are not nested in another one; the total of an outer
+    graft already holds those of the grafts beneath it'''
+    kept, tops = {}, set()
+    for path, inner in sorted(grafts.items(), key=lambda item: len(item[1].norm)):
+        if any(norm in tops for norm in _ancestors(inner.norm)):
+            continue
+
+        tops.add(inner.norm)
+        kept[path] = inner
+
+    return kept
+
+
+class RootScheduler:
+    '''Orders top level files for walking as they are read
+
+    Up to `window` roots are read ahead of the one being walked, and each is
+    matched against the roots in the window by its normalized path:
+
+    * a root inside a root that is still to be walked is `covered`; its total
+      is captured when the outer root is walked and it isn't walked itself
+    * a root containing earlier, already walked roots grafts their totals in
+      rather than walking those subtrees again; only the outermost of them
+      are grafted, as the walk stops there
+
+    Roots further apart than the window are walked independently. With a
+    `prefetcher`, the listings of the next roots are requested ahead of time
+    so several roots are being read at once.
+
+    :type files: iter([dirtree.entry.Entry])
+    :type window: int
+    :type prefetcher: dirtree.walker.Prefetcher or None
+    '''
+
+    def __init__(self, files, window=DEFAULT_ROOT_WINDOW, prefetcher=None):
+        self.files = iter(files)
+        self.window = window
+        self.prefetcher = prefetcher
+
+        self.ahead = deque()
+        self.behind = deque()
+        self.by_norm = {}
+        self.under = {}
+
+    def __register(self, root):
+        earlier = []
+        for norm in _ancestors(root.norm):
+            outer = self.by_norm.get(norm)
+            if outer is not None:
+                earlier.append(outer)
+
+        for outer in earlier:
+            if outer.total is not None and outer.norm == root.norm:
+                # the same root again, after it was walked
+                root.total, root.shown = outer.total, outer.shown
+                root.time_ns = outer.time_ns
+                root.shown_time_ns = outer.shown_time_ns
+                root.count = outer.count
+                root.yielded = outer.yielded
+                root.covered = True
+                break
+
+            if outer.total is None and not outer.covered:
+                # reached during the walk of a root that is still ahead
+                outer.captures[outer.path_of(root)] = root
+                root.covered = True
+                break
+
+        for inner in self.under.get(root.norm, ()):
+            root.grafts[root.path_of(inner)] = inner
+
+        self.by_norm.setdefault(root.norm, root)
+        for norm in _ancestors(os.path.dirname(root.norm)):
+            self.under.setdefault(norm, []).append(root)
+
+    def __forget(self, root):
+        if self.by_norm.get(root.norm) is root:
+            del self.by_norm[root.norm]
+
+        for norm in _ancestors(os.path.dirname(root.norm)):
+            inner = self.under.get(norm)
+            if inner is not None:
+                inner.remove(root)
+                if not inner:
+                    del self.under[norm]
+
+    def __fill(self):
+        while len(self.ahead) < self.window:
+            try:
+                entry = next(self.files)
+            except StopIteration:
+                return
+
+            root = Root(entry)
+            self.__register(root)
+            self.ahead.append(root)
+
+    def __prefetch(self):
+        if self.prefetcher is None:
+            return
+
+        for root in islice(self.ahead, self.prefetcher.jobs):
+            if not root.covered and root.entry.is_dir:
+                self.prefetcher.submit(root.entry)
+
+    def __iter__(self):
+        while True:
+            self.__fill()
+            if not self.ahead:
+                return
+
+            root = self.ahead.popleft()
+            self.__prefetch()
+
+            # the earlier roots nested in this one have been walked by now,
+            # unless they were excluded or unreadable
+            root.grafts = _outermost({
+                path: inner for path, inner in root.grafts.items()
+                if inner.total is not None
+            })
+            yield root
+
+            if self.prefetcher is not None:
+                self.prefetcher.discard(root.entry.path)
+
+            self.behind.append(root)
+            while len(self.behind) > self.window:
+                self.__forget(self.behind.popleft())
@@ -0,0 +1,214 @@
+from argparse import Namespace
+from array import array
+
+from .entry import Entry
+from .options import Options
+from .walker import EntryWalker
+
+IS_DIR = 1
+IS_LINKED = 2
+
+
+class Shard:
+    '''The partial aggregate of one subtree, as returned by a worker process
+
+    Records are kept in post-order in flat arrays: the path relative to
+    `path`, the depth below it, the size and newest time shown for it, and
+    flags. Every directory is recorded; files only with `options.all`, or when
+    they have more than one link.
+
+    Files with several links can't be deduplicated by the worker, since an
+    earlier shard may already have counted them, so they are left out of every
+    total and listed in `links` with their own size and time. `resolve` adds
+    back those seen for the first time, in walk order, to the records above
+    them; the others are not listed by `records`.
+
+    :type path: str
+    '''
+
+    __slots__ = (
+        'path', 'names', 'depths', 'sizes', 'times', 'flags', 'link_records',
+        'link_devices', 'link_inodes', 'link_sizes', 'link_times', 'total',
+        'time_ns', 'errors',
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.names = []
+        self.depths = array('I')
+        self.sizes = array('q')
+        self.times = array('q')
+        self.flags = bytearray()
+
+        self.link_records = array('Q')
+        self.link_devices = array('Q')
+        self.link_inodes = array('Q')
+        self.link_sizes = array('q')
+        self.link_times = array('q')
+
+        # the whole subtree, which isn't always what is shown for its root
+        self.total = 0
+        self.time_ns = 0
+        # directories the worker couldn't read, which it reported
+        self.errors = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, depth, size, time_ns, flags):
+        self.names.append(name)
+        self.depths.append(depth)
+        self.sizes.append(size)
+        self.times.append(time_ns)
+        self.flags.append(flags)
+
+    def add_link(self, device, inode, size, time_ns):
+        '''record the last record `add`ed as a file with several links'''
+        self.link_records.append(len(self.names) - 1)
+        self.link_devices.append(device)
+        self.link_inodes.append(inode)
+        self.link_sizes.append(size)
+        self.link_times.append(time_ns)
+
+    def __parents(self):
+        # in post-order, a record's parent is the first later record that is
+        # one level up
+        depths = self.depths
+        parents = array('q', [-1]) * len(depths)
+        pending = []
+        for idx, depth in enumerate(depths):
+            while pending and depths[pending[-1]] > depth:
+                parents[pending.pop()] = idx
+            pending.append(idx)
+
+        return parents
+
+    def resolve(self, links, separate_dirs=False):
+        '''count the linked files not yet in `links` where they are found
+
+        :type links: dirtree.links.InodeSet
+        :type separate_dirs: bool
+        '''
+        if not self.link_records:
+            return
+
+        parents = self.__parents()
+        sizes, times = self.sizes, self.times
+
+        for idx, device, inode, size, time_ns in zip(
+                self.link_records, self.link_devices, self.link_inodes,
+                self.link_sizes, self.link_times):
+            if not links.add(device, inode):
+                continue
+
+            sizes[idx] = size
+            times[idx] = time_ns
+            self.flags[idx] &= ~IS_LINKED
+            self.total += size
+            self.time_ns = max(self.time_ns, time_ns)
+
+            parent = parents[idx]
+            while parent >= 0:
+                sizes[parent] += size
+                times[parent] = max(times[parent], time_ns)
+                # with separate dirs, only the directory holding the file
+                # shows it
+                parent = -1 if separate_dirs else parents[parent]
+
+    def records(self):
+        '''yield `(path, depth, size, time_ns, is_dir)` for every record but
+        the linked files counted elsewhere; call `resolve` first'''
+        path = self.path
+        for name, depth, size, time_ns, flags in zip(
+                self.names, self.depths, self.sizes, self.times, self.flags):
+            if flags & IS_LINKED:
+                continue
+
+            yield (path + '/' + name if name else path, depth, size, time_ns,
+                   bool(flags & IS_DIR))
+
+
+def worker_args(options):
+    '''the arguments `options` are rebuilt from in a worker: open files are
+    replaced by what was read from them, and what only the parent handles is
+    left out
+
+    :type options: dirtree.options.Options
+    :rtype: argparse.Namespace
+    '''
+    args = Namespace(**vars(options._args))
+    args.files = []
+    args.files0_from = None
+    args.exclude = [pred.fn_pattern for pred in options.exclude]
+    args.exclude_from = None
+    args.cache = None
+    args.stats = False
+    args.watch = False
+    args.processes = None
+    return args
+
+
+def scan_shard(args, path):
+    '''walk the directory `path` in a worker process; see `Shard`
+
+    :type args: argparse.Namespace
+    :type path: str
+    :rtype: dirtree.shard.Shard
+    '''
+    from .aggregate import Aggregator, Level, fold
+
+    options = Options(args)
+    size = Aggregator(options, files=()).size
+    time_field = options.time_field
+    separate_dirs = options.separate_dirs
+    count_links = options.count_links
+    keep_files = options.all
+
+    shard = Shard(path)
+    prefix = len(path) + 1
+
+    # as in `Aggregator.aggregate`, with linked files left out
+    top = Level()
+    walker = EntryWalker(options, Entry(path))
+    for depth, entry, children, level in fold(walker.walk(), top):
+        is_dir = entry.is_dir
+        linked = not (count_links or is_dir) and entry.num_links > 1
+        if linked:
+            own = own_ns = 0
+        else:
+            own = size(entry)
+            own_ns = getattr(entry, time_field) if time_field else 0
+
+        total = own + children.total
+        level.total += total
+
+        children_ns = children.time_ns
+        time_ns = own_ns if own_ns > children_ns else children_ns
+        if time_ns > level.time_ns:
+            level.time_ns = time_ns
+
+        if not is_dir:
+            level.files += total
+            if time_ns > level.files_time_ns:
+                level.files_time_ns = time_ns
+
+        if separate_dirs and is_dir:
+            shown = own + children.files
+            shown_time_ns = max(own_ns, children.files_time_ns)
+        else:
+            shown, shown_time_ns = total, time_ns
+
+        if is_dir or linked or keep_files:
+            flags = (is_dir and IS_DIR) | (linked and IS_LINKED)
+            shard.add(entry.path[prefix:], depth, shown, shown_time_ns, flags)
+
+        if linked:
+            shard.add_link(
+                entry.device, entry.inode, size(entry),
+                getattr(entry, time_field) if time_field else 0,
+            )
+
+    shard.total = top.total
+    shard.time_ns = top.time_ns
+    shard.errors = walker.errors
+    return shard
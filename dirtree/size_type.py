@@ -62,6 +62,29 @@ def parse_size_type(string):
     return sign * sig * base ** unit
 
 
+def size_suffix(string):
+    '''.. function:: size_suffix(string)
+
+        returns the unit printed after sizes scaled by the block size `string`;
+        like `du`, only a unit given without a number (e.g., `M` or `KB`) is
+        printed
+
+            :param string: the command line argument
+            :type string: str
+    '''
+    match = re.match(r'(?i)^\s*([KMGTPEZY])(B?)\s*$', str(string or ''))
+    if not match:
+        return ''
+
+    unit, base = match.groups()
+    unit = unit.upper()
+
+    if base:
+        return ('k' if unit == 'K' else unit) + 'B'
+
+    return unit
+
+
 def humanize_size(n_bytes, base=1024):
     n_bytes = int(n_bytes)
 
@@ -0,0 +1,247 @@
+import heapq
+import os
+import tempfile
+from operator import attrgetter
+
+from .reader import Reader
+
+MAGIC = 'dirtree-snapshot'
+VERSION = 1
+
+#: records held in memory before a sorted run is spilled to disk
+DEFAULT_RUN_SIZE = 1 << 20
+
+
+def sort_key(path):
+    '''the order snapshots are kept in: by path component, so a directory is
+    followed directly by everything beneath it'''
+    return os.fsencode(path).replace(b'/', b'\0')
+
+
+class SnapshotRecord:
+    '''A directory, or a top level file, as saved in a snapshot
+
+    `size` is the usage of the whole subtree in the unit of the scan and
+    `count` the number of entries in it, the directory included.
+
+    :type path: str
+    :type size: int
+    :type count: int
+    :type mtime_ns: int
+    :type inode: int
+    '''
+
+    __slots__ = ('path', 'size', 'count', 'mtime_ns', 'inode', 'key')
+
+    def __init__(self, path, size, count, mtime_ns, inode):
+        self.path = path
+        self.size = size
+        self.count = count
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.key = sort_key(path)
+
+    def encode(self):
+        return b'%d\t%d\t%d\t%d\t%s' % (
+            self.size, self.count, self.mtime_ns, self.inode,
+            os.fsencode(self.path))
+
+    @classmethod
+    def decode(cls, record):
+        size, count, mtime_ns, inode, path = record.split(b'\t', 4)
+        return cls(
+            os.fsdecode(path), int(size), int(count), int(mtime_ns), int(inode))
+
+
+def _read_records(stream):
+    for record in Reader(stream, sep=b'\0'):
+        yield SnapshotRecord.decode(record)
+
+
+class SnapshotWriter:
+    '''Saves the directories of a scan, sorted by `sort_key`, to `path`
+
+    Records are `NUL` terminated, with the numbers tab separated before the
+    path, after a header naming the `unit` sizes are in. The walk produces
+    directories in post-order, so records are sorted `run_size` at a time and
+    spilled to temporary files, which are merged when the snapshot is closed;
+    memory stays bound by `run_size` however large the tree.
+
+    :type path: str
+    :type unit: str
+    :type run_size: int
+    '''
+
+    def __init__(self, path, unit='bytes', run_size=DEFAULT_RUN_SIZE):
+        self.path = path
+        self.unit = unit
+        self.run_size = run_size
+
+        self.__records = []
+        self.__runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, path, size, count, mtime_ns, inode):
+        self.__records.append(SnapshotRecord(
+            os.path.normpath(path), size, count, mtime_ns, inode))
+        if len(self.__records) >= self.run_size:
+            self.__spill()
+
+    def __sorted(self):
+        records, self.__records = self.__records, []
+        records.sort(key=lambda record: record.key)
+        return records
+
+    def __spill(self):
+        run = tempfile.TemporaryFile()
+        for record in self.__sorted():
+            run.write(record.encode() + b'\0')
+
+        run.seek(0)
+        self.__runs.append(run)
+
+    def close(self):
+        '''merge what was added into the snapshot file'''
+        if self.__records is None:
+            return
+
+        streams = [_read_records(run) for run in self.__runs]
+        streams.append(iter(self.__sorted()))
+        self.__records = None
+
+        header = '%s\t%d\t%s' % (MAGIC, VERSION, self.unit)
+        last = None
+        with open(self.path, 'wb') as fp:
+            fp.write(header.encode() + b'\0')
+            merged = heapq.merge(*streams, key=lambda record: record.key)
+            for record in merged:
+                # a path reached from two overlapping roots is saved once
+                if record.key != last:
+                    fp.write(record.encode() + b'\0')
+                    last = record.key
+
+        for run in self.__runs:
+            run.close()
+
+
+class Snapshot:
+    '''Reads a snapshot saved by `SnapshotWriter`, one record at a time
+
+    :type path: str
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.stream = open(path, 'rb')
+        self.__records = Reader(self.stream, sep=b'\0')
+
+        header = next(self.__records, b'').decode('utf-8', 'replace')
+        fields = header.split('\t')
+        if len(fields) != 3 or fields[0] != MAGIC:
+            self.close()
+            raise ValueError('%s is not a dirtree snapshot' % path)
+
+        if int(fields[1]) > VERSION:
+            self.close()
+            raise ValueError('%s is a newer snapshot version' % path)
+
+        self.unit = fields[2]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        for record in self.__records:
+            yield SnapshotRecord.decode(record)
+
+    def close(self):
+        self.stream.close()
+
+
+class Change:
+    '''A directory that differs between two snapshots
+
+    `status` is `new` or `deleted` for the top of a subtree that only exists
+    in one of them, with the whole subtree in the deltas, or `changed`.
+
+    :type path: str
+    :type status: str
+    :type size: int
+    :type count: int
+    '''
+
+    __slots__ = ('path', 'status', 'size', 'count')
+
+    def __init__(self, path, status, size, count):
+        self.path = path
+        self.status = status
+        self.size = size
+        self.count = count
+
+    def __repr__(self):
+        return '%s(%r, %r, size=%d, count=%d)' % (
+            type(self).__name__, self.path, self.status, self.size, self.count)
+
+
+def _is_below(key, top):
+    return top is not None and key.startswith(top) and key[len(top):][:1] == b'\0'
+
+
+def diff(old, new):
+    '''yield a `Change` for every directory whose size or count differs
+    between the snapshots `old` and `new`, in path order
+
+    Both are read in step, as a merge join on `sort_key`, so neither is held
+    in memory; a new or deleted subtree is reported once, at its top.
+
+    :type old: iter([dirtree.snapshot.SnapshotRecord])
+    :type new: iter([dirtree.snapshot.SnapshotRecord])
+    :rtype: iter([dirtree.snapshot.Change])
+    '''
+    old, new = iter(old), iter(new)
+    before, after = next(old, None), next(new, None)
+    added = removed = None
+
+    while before is not None or after is not None:
+        if after is None or (before is not None and before.key < after.key):
+            if not _is_below(before.key, removed):
+                removed = before.key
+                yield Change(before.path, 'deleted', -before.size, -before.count)
+
+            before = next(old, None)
+        elif before is None or after.key < before.key:
+            if not _is_below(after.key, added):
+                added = after.key
+                yield Change(after.path, 'new', after.size, after.count)
+
+            after = next(new, None)
+        else:
+            size = after.size - before.size
+            count = after.count - before.count
+            if size or count:
+                yield Change(after.path, 'changed', size, count)
+
+            before, after = next(old, None), next(new, None)
+
+
+def by_growth(changes, n=None):
+    '''`changes` sorted by how much they grew, the largest growth first and
+    deletions last; with `n`, only the first `n`, kept in a heap of `n` items
+    while the changes stream past
+
+    :type changes: iter([dirtree.snapshot.Change])
+    :type n: int or None
+    :rtype: [dirtree.snapshot.Change]
+    '''
+    if n:
+        return heapq.nlargest(n, changes, key=attrgetter('size'))
+
+    return sorted(changes, key=attrgetter('size'), reverse=True)
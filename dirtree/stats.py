@@ -0,0 +1,152 @@
+import heapq
+import sys
+import threading
+import time
+
+from .mixins import FieldsMixin
+
+#: the kinds of calls timed, in report order; `scandir` covers opening a
+#: directory, or waiting for the whole listing when it isn't read lazily, and
+#: `readdir` reading the next child of an open directory
+CALLS = ('scandir', 'readdir', 'lstat', 'stat', 'exclude', 'output')
+
+
+class ScanStats(FieldsMixin):
+    '''Counters and timings collected during a scan
+
+    Pass one to `EntryWalker`, `Aggregator` and `OutputWriter` (or set
+    `--stats`, which puts one on the options) and `start` it; the walker
+    hands it to the entries it lists, so their `lstat`, and the links it
+    follows (as `stat`), are timed in it and in no other scan. Nothing is
+    timed or counted by any of them while no `ScanStats` is given, which
+    leaves a `None` check on the paths that would be timed.
+
+    `calls` and `seconds` hold the number and total latency of each kind in
+    `CALLS`. Every directory's own time, from being opened to being finished
+    without the time spent in its subdirectories, is checked against the
+    `slowest` kept so far and passed to `callback`, if given, as
+    `callback(path, seconds, entries)`.
+
+    :type slowest: int
+    :type callback: callable or None
+    '''
+
+    __repr_fields__ = (
+        'dirs', 'entries', 'excluded', 'below_threshold', 'elapsed', 'calls',
+    )
+
+    def __init__(self, slowest=10, callback=None):
+        self.callback = callback
+        self.calls = dict.fromkeys(CALLS, 0)
+        self.seconds = dict.fromkeys(CALLS, 0.0)
+        self.dirs = 0
+        self.entries = 0
+        self.excluded = 0
+        self.below_threshold = 0
+        self.links_tracked = 0
+        self.links_bytes = 0
+
+        self.started = None
+        self.elapsed = 0.0
+
+        self.__keep = slowest
+        self.__slowest = []
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        '''start the clock'''
+        self.started = time.perf_counter()
+        return self
+
+    def stop(self):
+        if self.started is not None:
+            self.elapsed += time.perf_counter() - self.started
+            self.started = None
+
+    def record(self, kind, start):
+        '''count a call of `kind` that began at `start`, a `perf_counter` value;
+        calls may come from the threads of a parallel walk'''
+        seconds = time.perf_counter() - start
+        with self.__lock:
+            self.calls[kind] += 1
+            self.seconds[kind] += seconds
+
+    def directory(self, path, seconds, entries):
+        '''record a finished directory with `entries` children that took
+        `seconds` of its own'''
+        self.dirs += 1
+        self.entries += entries
+
+        item = (seconds, path)
+        if len(self.__slowest) < self.__keep:
+            heapq.heappush(self.__slowest, item)
+        elif item > self.__slowest[0]:
+            heapq.heapreplace(self.__slowest, item)
+
+        if self.callback is not None:
+            self.callback(path, seconds, entries)
+
+    @property
+    def slowest(self):
+        '''`(seconds, path)` of the slowest directories, slowest first
+
+        :rtype: [(float, str)]
+        '''
+        return sorted(self.__slowest, reverse=True)
+
+    @property
+    def dirs_per_second(self):
+        elapsed = self.elapsed
+        if self.started is not None:
+            elapsed += time.perf_counter() - self.started
+
+        return self.dirs / elapsed if elapsed else 0.0
+
+    def as_dict(self):
+        '''everything collected, as plain values'''
+        return {
+            'elapsed': self.elapsed,
+            'dirs': self.dirs,
+            'dirs_per_second': self.dirs_per_second,
+            'entries': self.entries,
+            'excluded': self.excluded,
+            'below_threshold': self.below_threshold,
+            'links_tracked': self.links_tracked,
+            'links_bytes': self.links_bytes,
+            'calls': dict(self.calls),
+            'seconds': dict(self.seconds),
+            'slowest': self.slowest,
+        }
+
+    def report(self, stream=None):
+        '''write a human readable summary, to stderr by default'''
+        if stream is None:
+            stream = sys.stderr
+
+        write = stream.write
+        write('%d directories, %d entries in %.3fs (%.1f directories/s)\n' % (
+            self.dirs, self.entries, self.elapsed, self.dirs_per_second))
+        write('%d excluded, %d below the threshold\n' % (
+            self.excluded, self.below_threshold))
+        write('%d hard linked inodes tracked in %d bytes\n' % (
+            self.links_tracked, self.links_bytes))
+
+        write('%-10s %10s %12s %12s\n' % ('call', 'count', 'total', 'average'))
+        for kind in CALLS:
+            count, seconds = self.calls[kind], self.seconds[kind]
+            if count:
+                write('%-10s %10d %11.3fs %10.2fus\n' % (
+                    kind, count, seconds, seconds / count * 1e6))
+
+        if self.__slowest:
+            write('slowest directories:\n')
+            for seconds, path in self.slowest:
+                write('%11.3fs  %s\n' % (seconds, path))
+
+        stream.flush()
@@ -0,0 +1,58 @@
+import heapq
+from operator import attrgetter
+
+#: what `--top` ranks by; `size` is an inode count with `--inodes`
+TOP_KEYS = {
+    'size': attrgetter('size'),
+    'time': attrgetter('time_ns'),
+}
+
+
+class TopN:
+    '''The `n` largest totals by `key`, kept in a heap of `n` items while the
+    totals stream past
+
+    Ties go to the total seen first. The grand total has no rank; it is kept
+    aside and listed last.
+
+    :type n: int
+    :type key: str
+    '''
+
+    def __init__(self, n, key='size'):
+        self.n = n
+        self.key = TOP_KEYS[key]
+        self.heap = []
+        self.grand_total = None
+        self.__seen = 0
+
+    def push(self, total):
+        '''offer `total`; it is kept only while it ranks in the top `n`
+
+        :type total: dirtree.aggregate.Total
+        '''
+        if total.entry is None:
+            self.grand_total = total
+            return
+
+        self.__seen += 1
+        # a later total loses a tie, so it is the smaller item
+        item = (self.key(total) or 0, -self.__seen, total)
+        if len(self.heap) < self.n:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def extend(self, totals):
+        for total in totals:
+            self.push(total)
+
+        return self
+
+    def __iter__(self):
+        '''the kept totals, largest first, then the grand total if any'''
+        for _, _, total in sorted(self.heap, reverse=True):
+            yield total
+
+        if self.grand_total is not None:
+            yield self.grand_total
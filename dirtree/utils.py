@@ -1,6 +1,4 @@
-import datetime
-
-from dateutil import tz
+from functools import lru_cache
 
 
 def identity(x):
@@ -8,9 +6,49 @@ def identity(x):
     return x
 
 
+@lru_cache(maxsize=None)
+def local_tz():
+    '''return the local timezone, built once per process'''
+    from dateutil import tz
+
+    return tz.tzlocal()
+
+
 def local_timestamp(ts):
     '''return a dst aware `datetime` object from `ts`'''
-    return datetime.datetime.fromtimestamp(ts, tz.tzlocal())
+    import datetime
+
+    return datetime.datetime.fromtimestamp(ts, local_tz())
+
+
+def ns_formatter(style):
+    '''return a callable formatting nanoseconds since the epoch as local time
+    in `style`
+
+    The local timezone comes from the C library rather than `dateutil`, and
+    the text for each second is remembered, since the entries of a tree tend
+    to share timestamps. Besides the `strftime` directives, `%N` is replaced
+    with the nine digits of nanoseconds.
+    '''
+    import datetime
+
+    fromtimestamp = datetime.datetime.fromtimestamp
+    utc = datetime.timezone.utc
+
+    def fmt(ns):
+        seconds, rest = divmod(ns, 10 ** 9)
+        mmt = fromtimestamp(seconds, utc).astimezone()
+        mmt = mmt.replace(microsecond=rest // 1000)
+        if '%N' in style:
+            return mmt.strftime(style.replace('%N', '%09d' % rest))
+
+        return mmt.strftime(style)
+
+    if '%f' in style or '%N' in style:
+        return fmt
+
+    cached = lru_cache(maxsize=4096)(fmt)
+    return lambda ns: cached(ns - ns % 10 ** 9)
 
 
 def strftime(ts):
@@ -1,80 +1,518 @@
 import os
-from itertools import chain
+import sys
+import time
+from collections import deque
 
+from .constants import DEFAULT_MAX_OPEN_DIRS
 from .entry import Entry
+from .filters import descend_filter, entry_filter
+from .links import InodeSet
+
+_DONE = object()
+
+_OPEN_FLAGS = os.O_RDONLY | os.O_DIRECTORY | getattr(os, 'O_CLOEXEC', 0)
+
+
+class _Dir:
+    '''a directory open as a file descriptor, closed once nothing refers to
+    it; the entries listed from it hold it until they are stat'd, and time
+    that in `stats`'''
+
+    __slots__ = ('fd', 'stats')
+
+    def __init__(self, name, at=None, follow=False, stats=None):
+        flags = _OPEN_FLAGS if follow else _OPEN_FLAGS | os.O_NOFOLLOW
+        self.fd = os.open(name, flags, dir_fd=None if at is None else at.fd)
+        self.stats = stats
+
+    def __del__(self):
+        fd = getattr(self, 'fd', None)
+        if fd is not None:
+            os.close(fd)
+
+
+def _opendir(entry, at=None, follow=False, stats=None):
+    '''open the directory `entry`, by name in the directory `at` if given;
+    a `follow`ed entry may be a symbolic link to one'''
+    return _Dir(entry.path if at is None else entry.name, at, follow, stats)
+
+
+def _entries(at, handle, path):
+    '''the entries read by the `scandir` iterator `handle` of the directory
+    open as `at`, found at `path`'''
+    prefix = path if path.endswith(os.sep) else path + os.sep
+    return (Entry(child, prefix + child.name, at) for child in handle)
+
+
+def _scandir(entry, at=None, follow=False, stats=None):
+    '''open the directory `entry` and start reading it; returns the open
+    directory, its `scandir` iterator and the entries it makes'''
+    sub = _opendir(entry, at, follow, stats)
+    handle = os.scandir(sub.fd)
+    return sub, handle, _entries(sub, handle, entry.path)
+
+
+def _list(at, path):
+    '''the children of the directory open as `at`, every one stat'd'''
+    with os.scandir(at.fd) as handle:
+        entries = list(_entries(at, handle, path))
+
+    for child in entries:
+        child.lstat()
+
+    return entries
+
+
+def _listdir(entry, at=None, follow=False, stats=None):
+    '''open the directory `entry` and list it with `_list`; runs on a worker
+    thread when the walk is parallel, the system calls release the GIL'''
+    sub = _opendir(entry, at, follow, stats)
+    return sub, _list(sub, entry.path)
+
+
+class Prefetcher:
+    '''Lists directories on a pool of `jobs` threads ahead of the walker
+
+    The walker still consumes listings in its own order, so the output order is
+    unchanged; the pool only keeps up to `window` listings in flight. With
+    `stats`, the children listed are timed in it.
+
+    :type jobs: int
+    :type window: int or None
+    :type stats: dirtree.stats.ScanStats or None
+    '''
+
+    def __init__(self, jobs, window=None, stats=None):
+        self.jobs = jobs
+        self.window = window or jobs * 4
+        self.stats = stats
+        self.pending = {}
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+
+    def submit(self, entry, at=None, follow=False):
+        '''list the directory `entry` ahead, by name in the directory `at` if
+        given, see `listdir`'''
+        if entry.path in self.pending or len(self.pending) >= self.window:
+            return
+
+        self.pending[entry.path] = self.executor.submit(
+            _listdir, entry, at, follow, self.stats)
+
+    def listdir(self, entry, at=None, follow=False):
+        '''the open directory `entry` and its stat'd children'''
+        future = self.pending.pop(entry.path, None)
+        if future is None:
+            return _listdir(entry, at, follow, self.stats)
+
+        return future.result()
+
+    def discard(self, path):
+        '''drop the listing of `path` if it was prefetched but isn't needed'''
+        future = self.pending.pop(path, None)
+        if future is not None:
+            future.cancel()
+
+    def close(self):
+        for future in self.pending.values():
+            future.cancel()
+
+        self.pending.clear()
+        self.executor.shutdown(wait=False)
+
+
+class _Frame:
+    __slots__ = (
+        'entry', 'dir', 'children', 'handle', 'error', 'checked', 'started',
+        'nested', 'count',
+    )
+
+    def __init__(self, entry, dir=None, children=(), handle=None, error=None,
+                 checked=False):
+        self.entry = entry
+        # the directory open, to reach the children by name
+        self.dir = dir
+        self.children = iter(children)
+        self.handle = handle
+        # whether the directories among `children` passed the descend filter
+        self.checked = checked
+        # why the directory couldn't be read, or read to the end
+        self.error = error
+        # only set while collecting stats
+        self.started = None
+
+    def release(self):
+        '''read the rest of the directory and stat it, so that its file
+        descriptors are closed'''
+        rest = []
+        try:
+            rest.extend(self.children)
+        except OSError as exc:
+            self.error = exc
+
+        for child in rest:
+            child.lstat()
+
+        self.children = iter(rest)
+        self.close()
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+        self.dir = None
 
 
 class EntryWalker:
-    '''Recursively walks down a path rooted at `entry` with `options`
+    '''Walks down a path rooted at `entry` with `options`, yielding entries in
+    post-order (children before their directory)
+
+    Directories that can't be read are reported on `stderr` and counted in
+    `errors`. Pass the same `visited` to the walkers of one scan to share what
+    they followed links to.
 
     :type options: dirtree.options.Options
     :type entry: dirtree.entry.Entry
+    :type jobs: int or None
+    :type max_open: int or None
+    :type cache: dirtree.cache.ScanCache or None
+    :type prefetcher: dirtree.walker.Prefetcher or None
+    :type stop: {str} or None
+    :type stats: dirtree.stats.ScanStats or None
+    :type visited: dirtree.links.InodeSet or None
     '''
 
-    def __init__(self, options, entry):
+    def __init__(self, options, entry, jobs=None, max_open=None, cache=None,
+                 prefetcher=None, stop=None, stats=None, visited=None):
         self.options = options
         self.entry = entry
-        self.queue = self.__descend(entry, options.dereference_args)
+        self.cache = options.cache if cache is None else cache
+        self.stop = stop
+        self.stats = options.stats if stats is None else stats
+
+        if jobs is None:
+            jobs = options.jobs
+
+        if max_open is None:
+            max_open = options.max_open_dirs or DEFAULT_MAX_OPEN_DIRS
+
+        self.max_open = max_open
+        self.__owns_prefetcher = prefetcher is None
+        # lists directories on a thread pool ahead of the walk, which still
+        # yields in the same order
+        if prefetcher is None and jobs and jobs > 1:
+            prefetcher = Prefetcher(jobs, stats=self.stats)
+
+        self.prefetcher = prefetcher
+
+        # an explicit stack, so depth isn't bound by the recursion limit
+        self.stack = []
+        self.errors = 0
+        # the frames holding their directory open, outermost first; past
+        # `max_open`, the outermost is read to the end and closed
+        self.__open = deque()
+        self.__seed = entry
+
+        if options.dereference_args and entry.is_symlink:
+            # the root is walked as what it points to, and -x keeps to the
+            # file system of that
+            entry = self.__seed = entry.follow(stats=self.stats)
+
+        self.__dereference = options.dereference
+        self.__follow_root = options.dereference_args
+        self.__descend = descend_filter(options, entry, self.stats)
+        self.__accept = entry_filter(options.threshold, self.stats)
+
+        # a followed link is walked as what it points to; with -L, what was
+        # reached once is skipped with everything beneath it
+        if visited is None and options.dereference and not options.count_links:
+            visited = InodeSet()
+
+        self.visited = visited
+        # with -L -l nothing is counted once, as du; only a directory being
+        # walked further up the stack is skipped, which ends link cycles
+        self.__walking = None
+        if visited is None and options.dereference:
+            self.__walking = set()
 
     def __iter__(self):
         return self
 
-    def __same_device(self, entry):
-        if not self.options.one_file_system:
-            return True
+    def __descends(self, entry):
+        '''whether `entry` is walked at all; excluded directories are pruned
+        here, before they are ever opened'''
+        descend = self.__descend
+        return descend is None or descend(entry)
 
-        if entry is self.entry:
-            return True
+    def __listdir(self, entry):
+        if self.stats is None:
+            return self.__list(entry)
 
-        return self.entry.device == entry.device
+        start = time.perf_counter()
+        frame = self.__list(entry)
+        frame.started = start
+        frame.nested = 0.0
+        frame.count = 0
+        return frame
 
-    def __excluded(self, entry):
-        for pred in self.options.exclude:
-            if pred(entry):
-                return True
+    def __timed(self, kind, func, *args):
+        stats = self.stats
+        if stats is None:
+            return func(*args)
 
-        return False
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            stats.record(kind, start)
 
-    def __threshold(self, entry):
-        thresh = self.options.threshold
-        if thresh is None:
-            return True
+    def __list(self, entry):
+        try:
+            return self.__read(entry)
+        except OSError as exc:
+            # reported once the directory is done, like any read error
+            return _Frame(entry, error=exc)
 
-        if thresh == 0:
-            return entry.size == 0
+    def __read(self, entry):
+        # the root is opened by its path, everything else by name in its
+        # parent, so that paths past PATH_MAX are walked too
+        at = self.__at()
+        follow = self.__dereference if at is not None else self.__follow_root
+        cache = self.cache
+        prefetcher = self.prefetcher
 
-        if thresh < 0:
-            return entry.size <= -thresh
+        if cache is not None:
+            sub, children = self.__timed(
+                'scandir', self.__lookup, entry, at, follow)
+            if children is not None:
+                return self.__hold(_Frame(entry, sub, children))
 
-        return thresh <= entry.size
+        if prefetcher is None:
+            sub, handle, children = self.__timed(
+                'scandir', _scandir, entry, at, follow, self.stats)
+            return self.__hold(_Frame(entry, sub, children, handle))
 
-    def __descend(self, entry, dereference=None):
-        if dereference is None:
-            dereference = self.options.dereference
+        sub, listed = self.__timed(
+            'scandir', prefetcher.listdir, entry, at, follow)
+        if cache is not None:
+            cache.store(entry, listed)
+
+        # the subdirectories are filtered here, before their listings are
+        # requested, and not again when they are pushed
+        children = []
+        for child in listed:
+            if child.is_dir:
+                if not self.__descends(child):
+                    continue
+
+                if cache is None or not cache.is_fresh(child):
+                    prefetcher.submit(child, sub, self.__dereference)
+
+            children.append(child)
+
+        return self.__hold(_Frame(entry, sub, children, checked=True))
+
+    def __lookup(self, entry, at, follow):
+        '''open the directory `entry` and find its listing in the cache; on a
+        miss, it is listed and cached here unless the prefetcher lists it'''
+        sub = _opendir(entry, at, follow, self.stats)
+        children = self.cache.lookup(entry, sub)
+        if children is None and self.prefetcher is None:
+            children = _list(sub, entry.path)
+            self.cache.store(entry, children)
+
+        return sub, children
 
-        if not self.__same_device(entry):
-            return ()
+    def __hold(self, frame):
+        '''count `frame` as open, releasing the outermost open frames past
+        `max_open`'''
+        opened = self.__open
+        while opened and len(opened) >= self.max_open:
+            opened.popleft().release()
 
-        result = (entry, )
+        opened.append(frame)
+        return frame
+
+    def __at(self):
+        '''the directory of the innermost frame, open again from the nearest
+        open one above it if it was released; `None` before the root'''
+        stack = self.stack
+        if not stack or stack[-1].dir is not None:
+            return stack[-1].dir if stack else None
+
+        depth = len(stack) - 1
+        while depth and stack[depth - 1].dir is None:
+            depth -= 1
+
+        at = stack[depth - 1].dir if depth else None
+        for depth in range(depth, len(stack)):
+            follow = self.__dereference if depth else self.__follow_root
+            at = _opendir(stack[depth].entry, at, follow, self.stats)
+
+        stack[-1].dir = at
+        self.__hold(stack[-1])
+        return at
+
+    def __push(self, entry, dereference=None, checked=False):
+        '''push the frames needed to walk `entry`; returns `entry` if it has
+        nothing beneath it and can be yielded immediately. A `checked` entry
+        already passed the descend filter'''
+        if dereference is None:
+            dereference = self.__dereference
 
         if dereference and entry.is_symlink:
-            ref = Entry(entry.readlink)
-            result = chain(self.__descend(ref), result)
+            try:
+                at = self.__at()
+            except OSError:
+                at = None
+
+            entry = entry.follow(None if at is None else at.fd, self.stats)
+
+        descend = self.__descend
+        if descend is not None and not checked and not descend(entry):
+            return None
+
+        if self.stop and entry.path in self.stop:
+            # yielded, but not entered
+            self.__unneeded(entry)
+            return entry
+
+        visited = self.visited
+        if visited is not None and not visited.add(entry.device, entry.inode):
+            # already walked, or being walked further up the stack
+            self.__unneeded(entry)
+            return None
 
         if not entry.is_dir:
-            return result
+            return entry
+
+        walking = self.__walking
+        if walking is not None:
+            key = (entry.device, entry.inode)
+            if key in walking:
+                self.__unneeded(entry)
+                return None
+
+            walking.add(key)
 
-        sub = os.scandir(entry.path)
-        sub = map(Entry, sub)
-        sub = map(self.__descend, sub)
-        sub = chain.from_iterable(sub)
+        # stat'd through its parent, which may be released while it is walked
+        entry.lstat()
+        self.stack.append(self.__listdir(entry))
+        return None
+
+    def __unneeded(self, entry):
+        # a listing requested ahead for a directory that won't be walked
+        if self.prefetcher is not None:
+            self.prefetcher.discard(entry.path)
+
+    def __pop(self):
+        frame = self.stack.pop()
+        if frame.dir is not None:
+            # an open frame is always the innermost open directory
+            self.__open.pop()
+            frame.close()
+
+        if frame.started is not None:
+            self.__finished(frame)
+
+        if frame.error is not None:
+            # yielded with what was read of it, as du does
+            self.__unreadable(frame)
+
+        entry = frame.entry
+        if self.__walking is not None:
+            self.__walking.discard((entry.device, entry.inode))
+
+        return entry
+
+    def __unreadable(self, frame):
+        self.errors += 1
+        error = frame.error
+        print("dirtree: cannot read directory '%s': %s" % (
+            frame.entry.path, error.strerror or error), file=sys.stderr)
+
+    def __finished(self, frame):
+        seconds = time.perf_counter() - frame.started
+        for parent in reversed(self.stack):
+            if parent.started is not None:
+                parent.nested += seconds
+                break
+
+        self.stats.directory(
+            frame.entry.path, seconds - frame.nested, frame.count)
+
+    def __next_child(self, frame):
+        '''the next child of `frame`, counted, and timed if it is read from
+        the open directory'''
+        if frame.handle is None:
+            child = next(frame.children, _DONE)
+        else:
+            start = time.perf_counter()
+            child = next(frame.children, _DONE)
+            self.stats.record('readdir', start)
+
+        if child is not _DONE:
+            frame.count += 1
+
+        return child
+
+    def __step(self):
+        if self.__seed is not None:
+            seed, self.__seed = self.__seed, None
+            entry = self.__push(seed, self.options.dereference_args)
+            if entry is not None:
+                return entry
+
+        stack = self.stack
+        while stack:
+            frame = stack[-1]
+            try:
+                if frame.started is None:
+                    child = next(frame.children, _DONE)
+                else:
+                    child = self.__next_child(frame)
+            except OSError as exc:
+                frame.error = exc
+                child = _DONE
+
+            if child is _DONE:
+                return self.__pop()
+
+            entry = self.__push(child, None, frame.checked and child.is_dir)
+            if entry is not None:
+                return entry
+
+        self.close()
+        raise StopIteration
+
+    def close(self):
+        '''release open directories and the worker threads of a parallel walk'''
+        while self.__open:
+            self.__open.pop().close()
+
+        if self.prefetcher is not None:
+            if self.__owns_prefetcher:
+                self.prefetcher.close()
+            self.prefetcher = None
+
+    def walk(self):
+        '''yield `(depth, entry)` for every walked entry, in post-order and
+        without threshold filtering; the root is at depth 0'''
+        while True:
+            try:
+                entry = self.__step()
+            except StopIteration:
+                return
 
-        result = chain(sub, result)
-        return result
+            # a leaf is never pushed, and a finished frame was just popped
+            yield len(self.stack), entry
 
     def __next__(self):
+        accept = self.__accept
         while True:
-            entry = next(self.queue)
-            assert isinstance(entry, Entry)
-            if not self.__excluded(entry) and self.__threshold(entry):
+            entry = self.__step()
+            if accept is None or accept(entry):
                 return entry
@@ -0,0 +1,531 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from .aggregate import Aggregator, Total, fold
+from .entry import Entry
+from .walker import EntryWalker
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR |
+    IN_DONT_FOLLOW | IN_EXCL_UNLINK
+)
+
+#: the mask of a file given as a root, whose changes come without a name
+FILE_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF |
+    IN_DONT_FOLLOW
+)
+
+#: events telling that a watched path no longer is what was walked
+SELF_MASK = IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    '''A minimal `ctypes` binding to the Linux inotify API'''
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+
+        return wd
+
+    def rm_watch(self, wd):
+        # the kernel may already have dropped it, which is fine
+        self._rm_watch(self.fd, wd)
+
+    def read(self, timeout=None):
+        '''yield `(wd, mask, cookie, name)` for the pending events, waiting up to
+        `timeout` seconds for the first one'''
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+
+        buf = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, length = _EVENT.unpack_from(buf, offset)
+            offset += _EVENT.size
+            name = buf[offset:offset + length].rstrip(b'\x00')
+            offset += length
+            yield wd, mask, cookie, os.fsdecode(name)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def max_user_watches(default=8192):
+    '''the kernel's per-user inotify watch limit'''
+    try:
+        with open('/proc/sys/fs/inotify/max_user_watches') as fp:
+            return int(fp.read())
+    except (OSError, ValueError):
+        return default
+
+
+class _Level:
+    '''the finished children collected at one depth by `Watcher`, see
+    `dirtree.aggregate.fold`: the sizes of files and the `(device, inode)` of
+    those with several links, by name, and the nodes of directories'''
+
+    __slots__ = ('files', 'links', 'dirs')
+
+    def __init__(self):
+        self.files = {}
+        self.links = {}
+        self.dirs = []
+
+
+class _Node:
+    '''a watched directory, or a file given as a root, and the usage of its
+    direct children
+
+    `links` maps the names of the children with several hard links to their
+    `(device, inode)`, see `Watcher`.
+    '''
+
+    __slots__ = (
+        'path', 'name', 'parent', 'own', 'files', 'dirs', 'links', 'total',
+        'wd', 'mtime_ns', 'device', 'is_dir',
+    )
+
+    def __init__(self, entry, own, files=None, dirs=()):
+        self.path = entry.path
+        self.name = entry.name
+        self.parent = None
+        self.own = own
+        self.files = {} if files is None else files
+        self.dirs = {node.name: node for node in dirs}
+        self.links = {}
+        self.total = own + sum(self.files.values())
+        self.wd = None
+        self.mtime_ns = entry.mtime_ns
+        self.device = entry.device
+        self.is_dir = entry.is_dir
+
+        for node in dirs:
+            node.parent = self
+            self.total += node.total
+
+    def add(self, delta):
+        node = self
+        while node is not None:
+            node.total += delta
+            node = node.parent
+
+    def walk(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.dirs.values())
+
+
+class Watcher:
+    '''Keeps the totals of directory trees current from inotify events
+
+    The trees are walked once with `EntryWalker`; afterwards every directory is
+    watched and only the entries named by an event are stat'd again, or, for a
+    new directory, walked. Changes are batched per `read` and the totals of the
+    roots that changed are yielded. A file given as a root is watched itself,
+    and a root that is deleted or moved away is walked again from its path;
+    while nothing is there, its total is 0 and the path is checked every
+    `interval` seconds.
+
+    A file with several hard links is counted once, at the first of its links
+    seen: the names holding each `(device, inode)` are tracked, so a link is
+    stat'd again without being mistaken for another one, and the usage moves
+    to the next link when the counted one goes. Every full scan starts the
+    tracking afresh.
+
+    At most `max_watches` directories are watched. The rest are re-listed when
+    their modification time changes, checked every `interval` seconds, and are
+    moved to the watch set as watches are released.
+
+    :type options: dirtree.options.Options
+    :type files: [dirtree.entry.Entry] or None
+    :type max_watches: int or None
+    :type interval: float
+    '''
+
+    def __init__(self, options, files=None, max_watches=None, interval=5.0):
+        if options.dereference:
+            raise ValueError('watching does not support `dereference`')
+
+        self.options = options
+        self.files = options.files if files is None else files
+        self.interval = interval
+
+        if max_watches is None:
+            # leave room for anything else the user is watching
+            max_watches = max_user_watches() * 3 // 4
+
+        self.max_watches = max_watches
+        self.inotify = Inotify()
+        self.watched = {}
+        self.unwatched = []
+        self.missing = []
+        self.roots = []
+        self.__size = Aggregator(options, files=()).size
+        # (device, inode) -> the [(node, name)] linking to it, the counted first
+        self.__links = {}
+
+    def __link_key(self, entry):
+        if self.options.count_links or entry.is_dir or entry.num_links < 2:
+            return None
+
+        return entry.device, entry.inode
+
+    def __link(self, node, name, key, size):
+        '''record `name` in `node` as a link to `key`, of `size`; returns what
+        it adds, with the link counted updated to `size` if it is another'''
+        holders = self.__links.setdefault(key, [])
+        if name not in node.links:
+            holders.append((node, name))
+            node.links[name] = key
+
+        owner, owner_name = holders[0]
+        if owner is node and owner_name == name:
+            return size
+
+        # the file was stat'd through another link
+        owner.add(size - owner.files[owner_name])
+        owner.files[owner_name] = size
+        return 0
+
+    def __unlink(self, node, name):
+        '''drop the link `name` of `node`, handing its usage to the next link'''
+        key = node.links.pop(name, None)
+        if key is None:
+            return
+
+        holders = self.__links[key]
+        counted = holders[0] == (node, name)
+        holders.remove((node, name))
+        if not holders:
+            del self.__links[key]
+        elif counted:
+            size = node.files.get(name, 0)
+            heir, heir_name = holders[0]
+            heir.files[heir_name] = size
+            heir.add(size)
+
+    def __build(self, entry):
+        top = _Level()
+        walk = EntryWalker(self.options, entry).walk()
+        for depth, child, children, level in fold(walk, top):
+            if child.is_dir or not depth:
+                node = _Node(
+                    child, self.__size(child), children.files, children.dirs)
+                for name, key in children.links.items():
+                    if not self.__link(node, name, key, node.files[name]):
+                        node.add(-node.files[name])
+                        node.files[name] = 0
+
+                level.dirs.append(node)
+            else:
+                level.files[child.name] = self.__size(child)
+                key = self.__link_key(child)
+                if key is not None:
+                    level.links[child.name] = key
+
+        if not top.dirs:
+            # the root itself was excluded
+            return None
+
+        root = top.dirs[0]
+        for node in root.walk():
+            self.__watch(node)
+
+        return root
+
+    def __root(self, path):
+        '''walk and watch the root at `path`; a placeholder while it is gone'''
+        entry = Entry(path)
+        if not entry.exists:
+            print("dirtree: cannot access '%s': %s" % (
+                path, os.strerror(errno.ENOENT)), file=sys.stderr)
+            node = _Node(entry, 0)
+            self.missing.append(node)
+            return node
+
+        return self.__build(entry)
+
+    def __watch(self, node):
+        if len(self.watched) < self.max_watches:
+            mask = WATCH_MASK if node.is_dir else FILE_WATCH_MASK
+            try:
+                node.wd = self.inotify.add_watch(node.path, mask)
+            except OSError as exc:
+                if exc.errno != errno.ENOSPC:
+                    raise
+
+                self.max_watches = len(self.watched)
+            else:
+                self.watched[node.wd] = node
+                return
+
+        self.unwatched.append(node)
+
+    def __forget(self, node):
+        # links handed to a node beneath are taken off with the whole subtree
+        for sub in node.walk():
+            for name in list(sub.links):
+                self.__unlink(sub, name)
+
+        if node.parent is not None:
+            node.parent.dirs.pop(node.name, None)
+            node.parent.add(-node.total)
+
+        for sub in node.walk():
+            sub.parent = None
+            if sub.wd is not None:
+                self.inotify.rm_watch(sub.wd)
+                self.watched.pop(sub.wd, None)
+                sub.wd = None
+
+    def __restat(self, node):
+        '''refresh the usage of `node` itself'''
+        entry = Entry(node.path)
+        if entry.exists:
+            own = self.__size(entry)
+            node.add(own - node.own)
+            node.own = own
+            node.mtime_ns = entry.mtime_ns
+
+    def __descends(self, node, entry):
+        '''whether `entry`, found in `node`, is counted, as the walk would'''
+        options = self.options
+        if options.exclude and options.exclude_matcher(entry):
+            return False
+
+        # with -x, every node is on the device of its root
+        return not (options.one_file_system and entry.is_dir and
+                    entry.device != node.device)
+
+    def __update(self, node, name, moved=True):
+        '''stat `name` in `node` again and fold the difference into the totals;
+        unless the entry may have been `moved`, a known subdirectory keeps its
+        subtree'''
+        old = node.dirs.get(name)
+        if old is not None and not moved:
+            self.__restat(old)
+            return
+
+        if old is not None:
+            self.__forget(old)
+
+        entry = Entry(os.path.join(node.path, name))
+        counted = entry.exists and self.__descends(node, entry)
+        key = self.__link_key(entry) if counted else None
+        if node.links.get(name) != key:
+            # no longer the same hard-linked file
+            self.__unlink(node, name)
+
+        delta = -node.files.pop(name, 0)
+        if counted and entry.is_dir:
+            sub = self.__build(entry)
+            if sub is not None:
+                sub.parent = node
+                node.dirs[name] = sub
+                delta += sub.total
+        elif counted:
+            size = self.__size(entry)
+            if key is not None:
+                size = self.__link(node, name, key, size)
+
+            node.files[name] = size
+            delta += size
+
+        node.add(delta)
+
+    def __relist(self, node):
+        '''list `node` again, for directories that are not watched'''
+        entry = Entry(node.path)
+        if not entry.is_dir:
+            if node in self.roots:
+                self.__rescan(node)
+            else:
+                self.__forget(node)
+            return
+
+        self.__restat(node)
+        listed = set(os.listdir(node.path))
+        for name in listed | set(node.files) | set(node.dirs):
+            moved = name not in listed or name not in node.dirs
+            self.__update(node, name, moved)
+
+    def __alive(self, node):
+        # forgotten nodes are detached from their parent
+        return node.parent is not None or node in self.roots
+
+    def __rescan(self, root):
+        '''walk the root `root` again from its path, after it was deleted,
+        moved or replaced'''
+        idx = self.roots.index(root)
+        self.__forget(root)
+        if root in self.missing:
+            self.missing.remove(root)
+
+        node = self.__root(root.path)
+        if node is None:
+            # excluded now, counted as nothing
+            node = _Node(Entry(root.path), 0)
+
+        self.roots[idx] = node
+
+    def check_unwatched(self):
+        '''watch directories as watches become free, list the remaining
+        unwatched directories again if they changed, and walk the roots that
+        were gone if they are back'''
+        for root in list(self.missing):
+            if os.path.lexists(root.path):
+                self.__rescan(root)
+
+        nodes, self.unwatched = self.unwatched, []
+        for node in nodes:
+            if not self.__alive(node):
+                continue
+
+            if len(self.watched) < self.max_watches:
+                self.__watch(node)
+                if node.wd is not None:
+                    # catch up on whatever happened while it wasn't watched
+                    self.__relist(node)
+                    continue
+
+                # put back by `__watch`
+                self.unwatched.pop()
+
+            entry = Entry(node.path)
+            if not entry.exists or entry.mtime_ns != node.mtime_ns:
+                self.__relist(node)
+
+            if self.__alive(node):
+                self.unwatched.append(node)
+
+    def scan(self):
+        '''walk every root and start watching it'''
+        for root in self.roots:
+            self.__forget(root)
+
+        self.roots = []
+        self.missing = []
+        self.__links = {}
+        for entry in self.files:
+            root = self.__root(entry.path)
+            if root is not None:
+                self.roots.append(root)
+
+    def totals(self, roots=None):
+        for root in self.roots if roots is None else roots:
+            yield Total(Entry(root.path), root.total)
+
+        if self.options.total:
+            yield Total(None, sum(root.total for root in self.roots))
+
+    def poll(self, timeout=None):
+        '''process one batch of events, waiting up to `timeout` seconds for it'''
+        changed = {}
+        nodes = set()
+        gone = []
+
+        for wd, mask, cookie, name in self.inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                self.scan()
+                return
+
+            node = self.watched.get(wd)
+            if node is None or mask & IN_IGNORED:
+                self.watched.pop(wd, None)
+                continue
+
+            if mask & SELF_MASK:
+                # any other node is updated from the event of its parent
+                if node in self.roots and node not in gone:
+                    gone.append(node)
+            elif name:
+                key = (node, name)
+                changed[key] = changed.get(key, 0) | mask
+            else:
+                nodes.add(node)
+
+        for root in gone:
+            self.__rescan(root)
+
+        for (node, name), mask in changed.items():
+            if self.__alive(node):
+                moved = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+                self.__update(node, name, bool(mask & moved))
+                nodes.add(node)
+
+        for node in nodes:
+            if self.__alive(node):
+                self.__restat(node)
+
+    def __iter__(self):
+        '''yield the totals after the initial scan and every time they change'''
+        self.scan()
+        yield from self.totals()
+
+        deadline = time.monotonic() + self.interval
+        while True:
+            before = {id(root): root.total for root in self.roots}
+
+            if self.unwatched or self.missing:
+                self.poll(max(0, deadline - time.monotonic()))
+                if time.monotonic() >= deadline:
+                    self.check_unwatched()
+                    deadline = time.monotonic() + self.interval
+            else:
+                self.poll()
+
+            changed = [
+                root for root in self.roots if before.get(id(root)) != root.total
+            ]
+            if changed:
+                yield from self.totals(changed)
+
+    def close(self):
+        self.inotify.close()
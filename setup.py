@@ -11,7 +11,7 @@ from setuptools.command.test import test as TestCommand
 
 here = os.path.abspath(os.path.dirname(__file__))
 
-packages = find_packages(exclude=('tests', ))
+packages = find_packages(exclude=('tests', 'bench'))
 
 requires = [
     'python-dateutil',
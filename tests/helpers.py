@@ -0,0 +1,28 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+needs_du = pytest.mark.skipif(shutil.which('du') is None, reason='needs du')
+
+
+def run(*args, cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    for name in ('DU_BLOCK_SIZE', 'BLOCK_SIZE', 'BLOCKSIZE', 'POSIXLY_CORRECT'):
+        env.pop(name, None)
+
+    out = subprocess.run(
+        args, cwd=cwd, env=env, stdout=subprocess.PIPE, check=True).stdout
+    return [line.split('\t', 1) for line in out.decode().splitlines()]
+
+
+def dirtree(*args, cwd):
+    return run(sys.executable, '-m', 'dirtree.cli', *args, cwd=cwd)
+
+
+def du(*args, cwd):
+    return run('du', *args, cwd=cwd)
@@ -0,0 +1,25 @@
+import os
+
+from dirtree.cache import ScanCache
+
+from helpers import dirtree, du, needs_du
+
+
+@needs_du
+def test_file_grown_in_place(tmp_path):
+    (tmp_path / 't').mkdir()
+    (tmp_path / 't' / 'f').write_bytes(b'x' * 100)
+    dirtree('--cache', 'cache.db', 't', cwd=tmp_path)
+
+    with open(str(tmp_path / 't' / 'f'), 'ab') as fp:
+        fp.write(b'x' * 200000)
+
+    assert dirtree('--cache', 'cache.db', 't', cwd=tmp_path) == du('t', cwd=tmp_path)
+
+
+def test_concurrent_scans(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = ScanCache(path), ScanCache(path)
+    first.close()
+    second.close()
+    assert os.listdir(str(tmp_path)) == ['cache.db']
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from helpers import ROOT, dirtree, du, needs_du
+
+
+@needs_du
+@pytest.mark.parametrize('args', [
+    ('-BM', '-k'), ('-BG', '-m'), ('-k', '-BM'), ('-m', '-b'), ('-BK', ),
+])
+def test_block_size(tmp_path, args):
+    (tmp_path / 't').mkdir()
+    (tmp_path / 't' / 'f').write_bytes(b'x' * 300000)
+    assert dirtree(*args, 't', cwd=tmp_path) == du(*args, 't', cwd=tmp_path)
+
+
+def test_closed_pipe(tmp_path):
+    for name in range(2000):
+        (tmp_path / ('f%d' % name)).write_bytes(b'')
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'dirtree.cli', '-a', str(tmp_path)], env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    proc.stdout.readline()
+    proc.stdout.close()
+    assert proc.wait() == 141
+    assert proc.stderr.read() == b''
+
+
+@pytest.mark.parametrize('args', [('--watch', '-L'), ('-j', '0'), ('-h', '--si')])
+def test_usage_error(tmp_path, args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run(
+        [sys.executable, '-m', 'dirtree.cli'] + list(args) + [str(tmp_path)],
+        env=env, stderr=subprocess.PIPE)
+    assert proc.returncode == 2
+    assert b'Traceback' not in proc.stderr
@@ -0,0 +1,50 @@
+from dirtree.links import _GOLDEN, _MASK64, InodeSet, _InodeTable
+
+
+def test_grows():
+    inodes = InodeSet()
+    assert inodes.nbytes == 0
+
+    for inode in range(1, 10001):
+        assert inodes.add(1, inode)
+
+    assert inodes.count == 10000
+    # kept at most half full
+    assert inodes.nbytes >= 10000 * 2 * 8
+    assert not any(inodes.add(1, inode) for inode in range(1, 10001))
+    assert all((1, inode) in inodes for inode in range(1, 10001))
+    assert (1, 10001) not in inodes
+
+
+def test_collisions():
+    def slot(inode):
+        return ((inode * _GOLDEN) & _MASK64) >> (64 - table.bits)
+
+    table = _InodeTable(bits=4)
+    # all in the last slot, so probing wraps around to the first
+    colliding = [inode for inode in range(1, 1000) if slot(inode) == 15][:8]
+    for inode in colliding:
+        assert table.add(inode)
+
+    assert table.bits == 4
+    assert all(inode in table for inode in colliding)
+    assert not any(table.add(inode) for inode in colliding)
+    assert [inode for inode in range(1, 1000) if inode in table] == colliding
+
+    # rehashed on growth
+    assert table.add(1000)
+    assert table.bits == 5
+    assert len(table) == 9
+    assert all(inode in table for inode in colliding + [1000])
+    assert not any(table.add(inode) for inode in colliding)
+
+
+def test_devices_and_zero():
+    inodes = InodeSet()
+    assert inodes.add(1, 0)
+    assert not inodes.add(1, 0)
+    assert inodes.add(2, 0)
+    assert inodes.add(2, 5)
+    assert (1, 5) not in inodes
+    assert (2, 5) in inodes
+    assert len(inodes) == 3
@@ -0,0 +1,39 @@
+import pytest
+
+from dirtree.packed import COLUMNS, PackedReader, PackedWriter
+
+
+def rows(n):
+    for idx in range(n):
+        path = 'root/dir%d/sub/file%d' % (idx // 7, idx)
+        if idx % 11 == 0:
+            path = 'root/caf\xe9/\udcff%d' % idx
+        yield (path, idx * 4096 - 1, idx * 8, 2 ** 64 - 1 - idx, idx, 1 + idx % 3,
+               1000, 1000, -idx * 10 ** 9, idx % 5)
+
+
+@pytest.mark.parametrize('count, block_size', [
+    (0, 4), (1, 4), (4, 4), (5, 4), (100, 16), (100, 7), (1000, 4096),
+])
+def test_round_trip(tmp_path, count, block_size):
+    path = tmp_path / 'totals.packed'
+    expected = list(rows(count))
+    with open(path, 'wb') as fp:
+        with PackedWriter(fp, 'apparent_size', block_size) as writer:
+            for row in expected:
+                writer.add(*row)
+
+    with PackedReader(str(path)) as reader:
+        assert reader.unit == 'apparent_size'
+        assert len(reader) == count
+        assert [tuple(record) for record in reader] == expected
+        assert [tuple(reader[idx]) for idx in range(count)] == expected
+        if count:
+            assert tuple(reader[-1]) == expected[-1]
+            for column, (name, _) in enumerate(COLUMNS, 1):
+                assert list(reader.column(name)) == [
+                    row[column] for row in expected]
+                assert reader.value_at(name, count - 1) == expected[-1][column]
+
+        with pytest.raises(IndexError):
+            reader[count]
@@ -0,0 +1,37 @@
+import pytest
+
+from dirtree.entry import Entry
+from dirtree.pattern import PatternMatcher, exclude
+
+PATTERNS = ['*.o', 'build', 'src/*.tmp', 'a/b/c', 'x?z', '[0-9]*', 'Core*']
+
+
+@pytest.mark.parametrize('path, excluded', [
+    ('lib/Foo.O', True),
+    ('lib/foo.so', False),
+    ('x/build', True),
+    ('x/build/y', False),
+    ('x/builder', False),
+    ('src/q.tmp', True),
+    ('q/src/q.tmp', True),
+    ('src/q/q.tmp', True),
+    ('q/src.tmp', False),
+    ('z/a/b/c', True),
+    ('a/b/cc', False),
+    ('d/xyz', True),
+    ('d/xz', False),
+    ('d/7up', True),
+    ('d/core.1', True),
+    ('d/score', False),
+])
+def test_matcher(path, excluded):
+    entry = Entry(path)
+    predicates = [exclude(pattern) for pattern in PATTERNS]
+    assert any(pred(entry) for pred in predicates) is excluded
+    assert PatternMatcher(predicates)(entry) is excluded
+
+
+def test_empty_matcher():
+    matcher = PatternMatcher()
+    assert not matcher
+    assert not matcher(Entry('a/b'))
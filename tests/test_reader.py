@@ -0,0 +1,63 @@
+import io
+
+import pytest
+
+from dirtree.reader import Reader
+
+RECORDS = [b'a', b'bc', b'def', b'x' * 37, b'ghij', b'k' * 5, b'lm']
+
+
+def joined(sep, records=RECORDS):
+    # doubled separators make empty records, which are skipped
+    return sep.join(records).replace(sep + b'bc', sep * 2 + b'bc') + sep
+
+
+@pytest.mark.parametrize('buf_size', [1, 2, 3, 5, 7, 64, 4096])
+@pytest.mark.parametrize('sep', [b'\0', b'\r\n', b'\r', b'\n'])
+def test_buffered(sep, buf_size):
+    stream = io.BytesIO(joined(sep))
+    assert list(Reader(stream, buf_size=buf_size)) == RECORDS
+
+
+@pytest.mark.parametrize('buf_size', [1, 2, 3, 5, 7, 64, 4096])
+@pytest.mark.parametrize('sep', [b'\0', b'\r\n', b'\r', b'\n'])
+def test_mapped(tmp_path, sep, buf_size):
+    path = tmp_path / 'list'
+    path.write_bytes(b'skipped' + sep + joined(sep))
+    with open(path, 'rb') as fp:
+        # only what is left of the stream is read, and all of it
+        fp.seek(len(b'skipped' + sep))
+        assert list(Reader(fp, buf_size=buf_size)) == RECORDS
+        assert fp.read() == b''
+
+
+@pytest.mark.parametrize('buf_size', [1, 2, 3, 64])
+def test_unterminated(tmp_path, buf_size):
+    data = b'\0'.join(RECORDS)
+    assert list(Reader(io.BytesIO(data), buf_size=buf_size)) == RECORDS
+
+    path = tmp_path / 'list'
+    path.write_bytes(data)
+    with open(path, 'rb') as fp:
+        assert list(Reader(fp, buf_size=buf_size)) == RECORDS
+
+
+@pytest.mark.parametrize('buf_size', [1, 2, 3, 64])
+def test_text(buf_size):
+    stream = io.StringIO('a\r\nbc\r\n\r\ndef')
+    assert list(Reader(stream, buf_size=buf_size)) == ['a', 'bc', 'def']
+
+
+def test_given_separator():
+    stream = io.BytesIO(b'a\nb\0c\nd\0')
+    assert list(Reader(stream, sep=b'\0', buf_size=3)) == [b'a\nb', b'c\nd']
+
+
+@pytest.mark.parametrize('data', [b'', b'single'])
+def test_without_separator(tmp_path, data):
+    assert list(Reader(io.BytesIO(data), buf_size=2)) == [data] * bool(data)
+
+    path = tmp_path / 'list'
+    path.write_bytes(data)
+    with open(path, 'rb') as fp:
+        assert list(Reader(fp, buf_size=2)) == [data] * bool(data)
@@ -0,0 +1,91 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+from helpers import ROOT, dirtree, du, needs_du
+
+
+@pytest.fixture
+def tree(tmp_path):
+    '''a/f1, a/b/f2 and a/b/c/f3, of different sizes'''
+    c = tmp_path / 'a' / 'b' / 'c'
+    c.mkdir(parents=True)
+    (tmp_path / 'a' / 'f1').write_bytes(b'x' * 5000)
+    (tmp_path / 'a' / 'b' / 'f2').write_bytes(b'x' * 100)
+    (c / 'f3').write_bytes(b'x' * 20000)
+    return tmp_path
+
+
+@needs_du
+@pytest.mark.parametrize('args', [
+    ('a/b', 'a/b/c', 'a'),
+    ('a/b/c', 'a/b', 'a'),
+    ('a', 'a/b', 'a/b/c'),
+    ('a/b', 'a/b', 'a'),
+])
+def test_nested_roots_total(tree, args):
+    assert dirtree('-c', *args, cwd=tree)[-1] == du('-c', *args, cwd=tree)[-1]
+
+
+def test_nested_roots_listed_once(tree):
+    paths = [path for _, path in dirtree('a/b', 'a/b/c', 'a', cwd=tree)]
+    assert paths == ['a/b/c', 'a/b', 'a']
+
+
+@needs_du
+def test_dereferenced_argument_walked_once(tree):
+    os.symlink('a', str(tree / 'ln'))
+    assert dirtree('-H', '-c', 'ln', cwd=tree)[-1] == du('-H', '-c', 'ln', cwd=tree)[-1]
+
+
+@pytest.fixture
+def elsewhere(tmp_path):
+    '''a directory with a subdirectory, on another file system than `tmp_path`'''
+    device = os.stat(str(tmp_path)).st_dev
+    for base in ('/dev/shm', '/run/user/%d' % os.getuid(), '/tmp'):
+        if os.path.isdir(base) and os.access(base, os.W_OK) and \
+                os.stat(base).st_dev != device:
+            break
+    else:
+        pytest.skip('needs a writable directory on another file system')
+
+    path = tempfile.mkdtemp(dir=base)
+    os.mkdir(os.path.join(path, 'sub'))
+    yield path
+    shutil.rmtree(path)
+
+
+@needs_du
+@pytest.mark.parametrize('follow', ['-H', '-L'])
+def test_one_file_system_through_linked_argument(tmp_path, elsewhere, follow):
+    os.symlink(elsewhere, str(tmp_path / 'lnk'))
+    output = dirtree('-x', follow, 'lnk', cwd=tmp_path)
+    assert output == du('-x', follow, 'lnk', cwd=tmp_path)
+    assert [path for _, path in output] == ['lnk/sub', 'lnk']
+
+
+@needs_du
+def test_missing_argument(tree):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run(
+        [sys.executable, '-m', 'dirtree.cli', 'missing', 'a/b/c'], cwd=str(tree),
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert proc.returncode == 1
+    assert proc.stdout.decode().splitlines() == [
+        '\t'.join(row) for row in du('a/b/c', cwd=tree)]
+    assert proc.stderr.decode() == (
+        "dirtree: cannot access 'missing': No such file or directory\n")
+
+
+def test_files0_from_undecodable_name(tmp_path):
+    os.mkdir(os.path.join(os.fsencode(str(tmp_path)), b'bad\xff'))
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run(
+        [sys.executable, '-m', 'dirtree.cli', '--files0-from', '-'],
+        cwd=str(tmp_path), env=env, input=b'bad\xff\0', stdout=subprocess.PIPE,
+        check=True)
+    assert proc.stdout.split(b'\t')[1] == b'bad\xff\n'
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from helpers import dirtree
+
+
+@pytest.fixture
+def hardlinked(tmp_path):
+    for sub in ('a', 'b/c', 'd', 'e/f/g'):
+        os.makedirs(tmp_path / sub)
+
+    for idx, path in enumerate(('a/x', 'b/c/y', 'e/f/g/z', 'top')):
+        (tmp_path / path).write_bytes(b'.' * 5000 * (idx + 1))
+
+    # links within a shard, across shards and to a file outside them
+    os.link(tmp_path / 'a/x', tmp_path / 'a/x2')
+    os.link(tmp_path / 'a/x', tmp_path / 'b/x3')
+    os.link(tmp_path / 'b/c/y', tmp_path / 'e/f/y2')
+    os.link(tmp_path / 'top', tmp_path / 'd/top2')
+    return tmp_path
+
+
+@pytest.mark.parametrize('args', [
+    (), ('-a',), ('-S',), ('-a', '-S'), ('-a', '-l'), ('-a', '--inodes'),
+    ('--apparent-size', '--time=ctime'), ('-a', '-d', '1'),
+])
+def test_processes_match_single_process(hardlinked, args):
+    single = dirtree(*args, '.', cwd=hardlinked)
+    assert dirtree('--processes', '3', *args, '.', cwd=hardlinked) == single
@@ -0,0 +1,49 @@
+from operator import attrgetter
+
+from dirtree.snapshot import SnapshotRecord, diff
+
+
+def records(*rows):
+    return sorted(
+        (SnapshotRecord(path, size, count, 0, 0) for path, size, count in rows),
+        key=attrgetter('key'),
+    )
+
+
+def test_diff():
+    old = records(
+        ('top', 100, 10),
+        ('top/a', 30, 3),
+        ('top/a/b', 10, 1),
+        ('top/gone', 20, 2),
+        ('top/gone/sub', 5, 1),
+        ('top/same', 40, 4),
+        ('top-sibling', 7, 1),
+    )
+    new = records(
+        ('top', 150, 12),
+        ('top/a', 30, 4),
+        ('top/a/b', 10, 1),
+        ('top/added', 60, 3),
+        ('top/added/sub', 8, 1),
+        ('top/same', 40, 4),
+        ('top-sibling', 9, 1),
+    )
+    changes = [
+        (change.path, change.status, change.size, change.count)
+        for change in diff(old, new)
+    ]
+    assert changes == [
+        ('top', 'changed', 50, 2),
+        ('top/a', 'changed', 0, 1),
+        ('top/added', 'new', 60, 3),
+        ('top/gone', 'deleted', -20, -2),
+        ('top-sibling', 'changed', 2, 0),
+    ]
+
+
+def test_diff_empty():
+    new = records(('top', 1, 1), ('top/a', 1, 1))
+    assert [change.status for change in diff([], new)] == ['new']
+    assert [change.status for change in diff(new, [])] == ['deleted']
+    assert list(diff(new, new)) == []
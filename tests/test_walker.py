@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from helpers import dirtree, du, needs_du
+
+
+@pytest.fixture
+def linked(tmp_path):
+    '''t/a/b/g and t/a/f, with t/l linking to t/a and t/a/b/up back to t/a'''
+    b = tmp_path / 't' / 'a' / 'b'
+    b.mkdir(parents=True)
+    (b / 'g').write_bytes(b'x' * 20000)
+    (tmp_path / 't' / 'a' / 'f').write_bytes(b'x' * 100)
+    os.symlink('a', str(tmp_path / 't' / 'l'))
+    os.symlink('..', str(b / 'up'))
+    return tmp_path
+
+
+@needs_du
+@pytest.mark.parametrize('args', [('-L', '-a'), ('-L', '-l', '-a')])
+def test_dereference(linked, args):
+    assert dirtree(*args, 't', cwd=linked) == du(*args, 't', cwd=linked)
+
+
+@pytest.fixture
+def deep(tmp_path):
+    '''nested directories `deep/d/d/...`, each holding a file `f`, made by
+    name so that the path outgrows PATH_MAX; removed the same way'''
+    levels = os.pathconf(str(tmp_path), 'PC_PATH_MAX') // 2 + 10
+    flags = os.O_RDONLY | os.O_DIRECTORY
+    (tmp_path / 'deep').mkdir()
+    fd = os.open(str(tmp_path / 'deep'), flags)
+    try:
+        for _ in range(levels):
+            os.mkdir('d', dir_fd=fd)
+            out = os.open('f', os.O_WRONLY | os.O_CREAT, dir_fd=fd)
+            os.write(out, b'x' * 100)
+            os.close(out)
+            parent, fd = fd, os.open('d', flags, dir_fd=fd)
+            os.close(parent)
+
+        yield tmp_path
+
+        # too deep for `shutil.rmtree`, which recurses
+        for _ in range(levels):
+            child, fd = fd, os.open('..', flags, dir_fd=fd)
+            os.close(child)
+            os.rmdir('d', dir_fd=fd)
+            os.unlink('f', dir_fd=fd)
+    finally:
+        os.close(fd)
+
+
+@needs_du
+@pytest.mark.parametrize('args', [(), ('-j', '3'), ('--max-open-dirs', '2')])
+def test_past_path_max(deep, args):
+    assert dirtree('-s', *args, 'deep', cwd=deep) == du('-s', 'deep', cwd=deep)